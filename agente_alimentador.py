@@ -6,13 +6,15 @@ from pade.acl.messages import ACLMessage
 from pade.acl.aid import AID
 from pade.behaviours.protocols import FipaRequestProtocol
 from pade.behaviours.protocols import FipaContractNetProtocol
-from xml2objects import carregar_topologia
-
-from rede import Fasor
-from rnp import Arvore
+from topologia import obter_armazem
+from alimentador_indexado import (nomes_dos_setores, setores_na_profundidade,
+                                  OperacaoInconsistente)
+from restauracao import EscalonadorDeRamos, bisseccao, limite_inferior_de_poda
+from fluxo_de_carga import (calcular_fluxo_de_carga, rede_radial, alivios, Violacao,
+                            verificar_carregamento, verificar_tensao, LigacaoInexistente)
 
 import json
-import pickle
+import weakref
 
 import numpy as np
 
@@ -77,7 +79,7 @@ class CompRequest1(FipaRequestProtocol):
             message = ACLMessage(ACLMessage.CFP)
             message.set_protocol(ACLMessage.FIPA_CONTRACT_NET_PROTOCOL)
             message.set_content(json.dumps({'ref': 'CN_01',
-                                            'dados': pickle.dumps(rams_desener)
+                                            'dados': [ramo.resumo() for ramo in rams_desener]
                                             },
                                 indent=4))
 
@@ -95,9 +97,8 @@ class CompRequest1(FipaRequestProtocol):
         chave = self.agent.alimentador.chaves[str(chave_atuada)]
         setor_1 = chave.n1
         setor_2 = chave.n2
-        rnp = self.agent.alimentador.rnp_dic()
-        prof_1 = rnp[setor_1.nome]
-        prof_2 = rnp[setor_2.nome]
+        prof_1 = self.agent.alimentador.profundidade(setor_1.nome)
+        prof_2 = self.agent.alimentador.profundidade(setor_2.nome)
         if prof_1 > prof_2:
             return setor_1.nome
         else:
@@ -105,17 +106,11 @@ class CompRequest1(FipaRequestProtocol):
 
     def encontrar_rams_desener(self):
         setor_sob_falta = self.encontrar_setor_sob_falta()
-        rnp = self.agent.alimentador.rnp_dic()
-        prof = rnp[setor_sob_falta]
-        setores_adjacentes = list()
-        for i in range(np.size(self.agent.alimentador.rnp, axis=1)):
-            if int(self.agent.alimentador.rnp[0, i]) == (int(prof) + 1):
-                setores_adjacentes.append(self.agent.alimentador.rnp[1, i])
 
         chaves_de_isolacao = list()
-        for chave in self.agent.alimentador.chaves.values():
-            if (chave.n1.nome or chave.n2.nome) == setor_sob_falta:
-                chaves_de_isolacao.append(chave.nome)
+        for chave in self.agent.alimentador.chaves_do_setor(setor_sob_falta):
+            if self.agent.alimentador.chaves[chave].n1.nome == setor_sob_falta:
+                chaves_de_isolacao.append(chave)
 
         rams_desener = list()
         setores_poda = list()
@@ -167,9 +162,10 @@ class CompRequest2(FipaRequestProtocol):
             display_message(self.agent.aid.name, 'Mensagem REQUEST recebida')
             if self.content['dados']['tipo'] == 'poda':
 
-                alimentador = self.agent.topologia['alimentadores'][
-                    self.content['dados']['alimentador']
-                ]
+                # o alimentador e copiado do armazem compartilhado
+                # antes da primeira alteracao feita por este agente
+                alimentador = self.agent.topologia.alimentador_mutavel(
+                    self.content['dados']['alimentador'])
 
                 self.setores = self.content['dados']['setores']
                 for setor in self.setores:
@@ -177,16 +173,14 @@ class CompRequest2(FipaRequestProtocol):
                     self.agent.podas.append(poda)
 
             elif self.content['dados']['tipo'] == 'insercao':
-                alimentador = self.agent.topologia['alimentadores'][
-                    self.content['dados']['alimentador']
-                ]
+                alimentador = self.agent.topologia.alimentador_mutavel(
+                    self.content['dados']['alimentador'])
 
                 no, no_raiz = self.content['dados']['setores']
 
                 for poda in self.agent.podas:
 
-                    setores_poda = poda[0].keys()  # 0 : dict de setores da poda
-                    if no_raiz in setores_poda:
+                    if no_raiz in poda.setores:
 
                         alimentador.inserir_ramo(str(no), poda, str(no_raiz))
                         self.agent.podas.remove(poda)
@@ -337,7 +331,7 @@ class CompContNet1(FipaContractNetProtocol):
                 message = ACLMessage(ACLMessage.CFP)
                 message.set_protocol(ACLMessage.FIPA_CONTRACT_NET_PROTOCOL)
                 message.set_content(json.dumps({'ref': 'CN_01',
-                                                'dados': pickle.dumps(self.agent.podas)
+                                                'dados': [ramo.resumo() for ramo in self.agent.podas]
                                                 },
                                     indent=4))
 
@@ -412,8 +406,9 @@ class CompContNet2(FipaContractNetProtocol):
         if content['ref'] == 'CN_01':
             display_message(self.agent.aid.name, 'Mensagem CFP recebida')
 
-            # self.agent.ramos_nao_energizados = pickle.loads(
-            # json.loads(self.message.content)['dados'])
+            # resumos dos ramos (Poda.resumo) enviados no CFP:
+            # self.agent.ramos_nao_energizados = json.loads(
+            # self.message.content)['dados']
 
             chaves_recomp = selec_ramos_possiveis(self.agent.podas,
                                                   self.agent.alimentador)
@@ -455,10 +450,10 @@ class CompContNet2(FipaContractNetProtocol):
         if content['ref'] == 'CN_03':
             display_message(self.agent.aid.name,
                             'Mensagem ACCEPT_PROPOSE recebida')
-            inserir_ramos_recursivo(self.agent,
-                                    self.agent.alimentador,
-                                    self.agent.subestacao,
-                                    self.agent.podas)
+            restaurar_ramos(self.agent,
+                            self.agent.alimentador,
+                            self.agent.subestacao,
+                            list(self.agent.podas))
 
             resposta = message.create_reply()
             resposta.set_performative(ACLMessage.INFORM)
@@ -468,20 +463,19 @@ class CompContNet2(FipaContractNetProtocol):
 
 class AgenteAlimentador(Agent):
 
-    def __init__(self, aid):
+    def __init__(self, aid, armazem=None):
         super(AgenteAlimentador, self).__init__(aid=aid, debug=False)
 
-        self.topologia = carregar_topologia()
-
-        self.alimentador = self.topologia['alimentadores'][
-            self.aid.localname]
-
-        for sub in self.topologia['subestacoes'].values():
-            if self.aid.localname in sub.alimentadores.keys():
-                self.subestacao = sub
+        # a topologia e carregada uma unica vez por processo e
+        # compartilhada entre os agentes; apenas o alimentador
+        # do proprio agente e copiado para a sua visao
+        if armazem is None:
+            armazem = obter_armazem()
+        self.armazem = armazem
+        self.topologia = armazem.visao([self.aid.localname])
+        self.atualizar_referencias()
 
         self.agente_dispositivo_aid = None
-        self.comunicacao = self.topologia['comunicacao']
         self.agentes_solicitados = list()
         self.podas = list()
 
@@ -501,6 +495,39 @@ class AgenteAlimentador(Agent):
     def carregar_info(self):
         pass
 
+    def atualizar_referencias(self):
+        self.alimentador = self.topologia['alimentadores'][
+            self.aid.localname]
+
+        for sub in self.topologia['subestacoes'].values():
+            if self.aid.localname in sub.alimentadores.keys():
+                self.subestacao = sub
+
+        self.comunicacao = self.topologia['comunicacao']
+
+    def recarregar_topologia(self):
+        """Le novamente o arquivo da rede e aplica na visao do agente
+        apenas o que mudou, retornando a DiferencaTopologia aplicada
+        ou None se nada mudou.
+
+        Alteracoes de parametros (cargas, estados de chaves, condutores)
+        sao aplicadas sem alterar a RNP do alimentador, inclusive nos
+        setores podados. Alteracoes estruturais no alimentador do agente
+        sao adiadas enquanto houver podas em andamento.
+        """
+        self.armazem.recarregar()
+
+        adiar = [self.aid.localname] if self.podas else []
+        diferenca = self.topologia.sincronizar(podas=self.podas, adiar=adiar)
+
+        if diferenca is not None:
+            self.atualizar_referencias()
+            display_message(self.aid.name, 'Topologia recarregada: %r' % diferenca)
+            if self.topologia.pendentes:
+                display_message(self.aid.name,
+                                'Alteracao estrutural adiada ate o fim da restauracao')
+        return diferenca
+
 
 def notificar_agentes(agent, tipo, alimentador, setores):
     # Envia mensagem para atualizar os outros agentes
@@ -532,55 +559,66 @@ def selec_ramos_possiveis(ramos, alimentador):
     chaves = alimentador.chaves.keys()
     chaves_recomp = list()
     for ramo in ramos:
-        chaves_ramo = ramo[6]  # 6: posicao das chaves no ramo de poda
-        for i in chaves_ramo.keys():
+        # apenas as chaves de fronteira do ramo podem pertencer
+        # a outro alimentador
+        for i in ramo.chaves_de_fronteira:
             if i in chaves:
                 chaves_recomp.append(i)
 
     return chaves_recomp
 
 
-def calcular_potencia_disponivel(subestacao):
+# potencia total dos transformadores de cada subestacao, calculada
+# uma unica vez por objeto Subestacao
+_potencia_dos_trafos = weakref.WeakKeyDictionary()
+
 
-    # calcula a potencia total consumida pelos alimentadores
-    pot_cons = Fasor(real=0.0, imag=0.0, tipo=Fasor.Potencia)
-    for alimentador in subestacao.alimentadores.values():
-        pot_cons = pot_cons + alimentador.calcular_potencia()
+def potencia_dos_trafos(subestacao):
+    potencia_trafos = _potencia_dos_trafos.get(subestacao)
+    if potencia_trafos is None:
+        potencia_trafos = sum((complex(trafo.potencia.real, trafo.potencia.imag)
+                               for trafo in subestacao.transformadores.values()), 0j)
+        _potencia_dos_trafos[subestacao] = potencia_trafos
+    return potencia_trafos
 
-    # calcula a potencia total dos transformadores da subestacao
-    potencia_trafos = Fasor(real=0.0, imag=0.0, tipo=Fasor.Potencia)
-    for trafo in subestacao.transformadores.values():
-        potencia_trafos = potencia_trafos + trafo.potencia
 
-    return potencia_trafos.mod - pot_cons.mod
+def calcular_potencia_disponivel(subestacao):
 
+    # potencia total consumida pelos alimentadores, mantida por
+    # AlimentadorIndexado a cada poda e insercao de ramo
+    pot_cons = sum((alimentador.potencia_total
+                    for alimentador in subestacao.alimentadores.values()), 0j)
 
-def verificar_carregamento_dos_condutores(agent, subestacao):
-    """verifica o carregamento dos condutores após inserção
-    de ramo afetado
-    """
-    for alimentador in subestacao.alimentadores.values():
-        for trecho in alimentador.trechos.values():
-            if trecho.fluxo.mod > trecho.condutor.ampacidade:
-                display_message(agent.aid.name, 'Restrição de carregamento de condutores ' \
-                      'atingida no trecho {t}'.format(t=trecho.nome))
-                return trecho.nome
-    else:
-        return None
+    return abs(potencia_dos_trafos(subestacao)) - abs(pot_cons)
 
 
-def verificar_nivel_de_tensao(agent, subestacao):
-    """verifica nivel de tensao nos nós de carga
+def verificar_carregamento_dos_condutores(agent, subestacao, resultados=None):
+    """verifica o carregamento dos condutores após inserção
+    de ramo afetado. Retorna todas as violações (Violacao), da
+    menor para a maior margem
     """
-    for alimentador in subestacao.alimentadores.values():
-            for no in alimentador.nos_de_carga.values():
-                if no.tensao.mod < 0.95 * subestacao.tensao.mod or \
-                   no.tensao.mod > 1.05 * subestacao.tensao.mod:
-                    display_message(agent.aid.name, 'Restrição de Tensão atingida ' \
-                          'no nó de carga {no}'.format(no=no.nome))
-                    return no.nome
-    else:
-        return None
+    if resultados is None:
+        resultados = calcular_fluxo_de_carga(subestacao, escrever=False)
+    violacoes = verificar_carregamento(subestacao, resultados)
+    for violacao in violacoes:
+        display_message(agent.aid.name, 'Restrição de carregamento de condutores ' \
+              'atingida no trecho {t} (margem {m:.1%})'.format(t=violacao.elemento,
+                                                              m=violacao.margem))
+    return violacoes
+
+
+def verificar_nivel_de_tensao(agent, subestacao, resultados=None):
+    """verifica nivel de tensao nos nós de carga. Retorna todas as
+    violações (Violacao), da menor para a maior margem
+    """
+    if resultados is None:
+        resultados = calcular_fluxo_de_carga(subestacao, escrever=False)
+    violacoes = verificar_tensao(subestacao, resultados)
+    for violacao in violacoes:
+        display_message(agent.aid.name, 'Restrição de Tensão atingida ' \
+              'no nó de carga {no} (margem {m:.1%})'.format(no=violacao.elemento,
+                                                           m=violacao.margem))
+    return violacoes
 
 
 def identificar_setor_de_insercao(ramo, alimentador):
@@ -591,12 +629,11 @@ def identificar_setor_de_insercao(ramo, alimentador):
     # carrega as chaves do alimentador de recomposição
     chaves_alimen = alimentador.chaves
 
-    # carrega as chaves do ramo a ser recomposto
-    chaves_ramo = ramo[6]  # 6: posicao das chaves no ramo de poda
+    # carrega as chaves de fronteira do ramo a ser recomposto
+    chaves_ramo = ramo.chaves_de_fronteira
 
     # verifica quais chaves existem em comum entre estes ramos
-    chaves_recomp = [i for i in chaves_alimen.keys()
-                     if i in chaves_ramo.keys()]
+    chaves_recomp = [i for i in chaves_ramo if i in chaves_alimen]
 
     pares_setores_recomp = []
     # se não existirem chaves em comum
@@ -618,12 +655,25 @@ def identificar_setor_de_insercao(ramo, alimentador):
         return pares_setores_recomp
 
 
+def encontrar_chave_de_isolacao(alimentador, setor):
+    """Chave que isola do alimentador o setor podado"""
+    chave_de_isolacao = None
+    # percorre as chaves do setor podado
+    for chave in alimentador.chaves_do_setor(setor):
+        # se a chave fizer fronteira com a rnp
+        if alimentador.chaves[chave].n1.nome in alimentador.profundidades or \
+        alimentador.chaves[chave].n2.nome in alimentador.profundidades:
+            chave_de_isolacao = chave
+    return chave_de_isolacao
+
+
 def podar_setor_mais_profundo(agent,
                               alimentador,
                               setores_analisados,
                               setores_mais_profundos,
                               rnp_de_setor,
-                              profundidade):
+                              profundidade,
+                              transacao=None):
     """metodo utilizado sempre que qualquer uma das restrições: potencia,
     carregamento dos condutores, ou níveis de tensão; sejam atingidas.
     Recebe como parâmetro uma lista com os setores que têm a profundidade
@@ -636,293 +686,352 @@ def podar_setor_mais_profundo(agent,
     # ordena a lista de setores analisados
     setores_analisados.sort()
 
-    # -se- a lista setores_mais_profundos estiver vazia e a lista
-    # setores_analisados contiver todos os setores do alimentador
+    # -se- a lista setores_mais_profundos estiver vazia ela é
+    # atualizada com os setores da profundidade indicada, que é
+    # então reduzida de menos 1
+    # -se- não houver setores nessa profundidade, ou a lista
+    # setores_analisados contiver todos os setores do ramo,
     # então não existem mais possibilidades
-    # -se não- a lista de setores_mais_profundos é atualizada com
-    # a profundidade reduzida de menos 1
-    if setores_mais_profundos == [] and \
-       setores_analisados != list(rnp_de_setor[1, :]).sort():
-
+    if setores_mais_profundos == []:
         # encontra quais os setores com maior profundidade
-        # no ramo podado
-        setores_mais_profundos = list(
-            rnp_de_setor[1, np.where(
-                rnp_de_setor[0, :] == str(profundidade))])
+        # no ramo podado (rnp_de_setor e a RNP inteira do ramo)
+        setores_mais_profundos = nomes_dos_setores(
+            rnp_de_setor[1, setores_na_profundidade(rnp_de_setor, profundidade)])
         profundidade -= 1
-    else:
+
+    if setores_mais_profundos == [] or \
+       setores_analisados == sorted(nomes_dos_setores(rnp_de_setor[1, :])):
         display_message(agent.aid.name, 'A recomposicao do ramo nao foi possivel!')
         return None
 
     # retira o setor a ser podado da lista de setores mais profundos
-    setor = setores_mais_profundos.pop(0)[0]
+    setor = setores_mais_profundos.pop(0)
 
     # insere o setor podado na lista de setores analisados
     setores_analisados.append(setor)
 
 
     display_message(agent.aid.name, 'Poda do setor: {setor}'.format(setor=setor))
-    # realiza a poda do setor
-    poda = alimentador.podar(setor, alterar_rnp=True)
+    # realiza a poda do setor, registrando-a na transação, se houver;
+    # nesse caso os outros agentes são notificados na confirmação
+    if transacao is not None:
+        poda = transacao.podar(setor)
+    else:
+        poda = alimentador.podar(setor, alterar_rnp=True)
 
 
     # encontra a chave que isola o ramo do setor podado
-    chave_de_isolacao = None
-    # percorre as chaves do alimentador
-    for chave in alimentador.chaves.keys():
-        # se for chave do setor a ser podado, entra no if
-        if alimentador.chaves[chave].n1.nome == setor or alimentador.chaves[chave].n2.nome == setor:
-            # se a chave fizer fronteira com a rnp
-            # print 'chave pertence ao setor: ', chave
-            # print 'rnp  de alimentador: ', alimentador.rnp
-            if alimentador.chaves[chave].n1.nome in alimentador.rnp[1, :] or \
-            alimentador.chaves[chave].n2.nome in alimentador.rnp[1, :]:
-                chave_de_isolacao = chave
-                # print '>>chave de isolação ', chave_de_isolacao
+    chave_de_isolacao = encontrar_chave_de_isolacao(alimentador, setor)
 
     # Envia mensagem para atualizar os outros agentes
     # que também têm uma representação da rede
-    notificar_agentes(agent,
-                      'poda',
-                      alimentador.nome,
-                      setor)
+    if transacao is None:
+        notificar_agentes(agent,
+                          'poda',
+                          alimentador.nome,
+                          [setor])
 
     # retorna uma tupla de setores_mais_profundos
     return setores_analisados, setores_mais_profundos, profundidade, poda, chave_de_isolacao
 
 
-def inserir_ramos_recursivo(agent, alimentador, subestacao, ramos):
-    
-    # Escolha da ordem de inserção dos ramos de acordo com as 
-    # prioridades
-
-    # calculo dos indices de prioridade de cada ramo
-    # de acordo com a seguinte equação:
-    #                         soma_das_prioridades  
-    #   prioridade_media =  -------------------------
-    #                       numero de setores do ramo
-
-    indice_prioridades_dict = {}
-    for ramo in ramos:
-        soma_prioridades = 0
-        for setor in ramo[0].values():
-            soma_prioridades += setor.prioridade
-
-        # indice_prioridades_dict é um dicionario contendo pares
-        # chave/valor, as chaves são o identificador do objeto
-        # ramo e os valores são tuplas com o primeiro elemento
-        # o indice de prioridade e o segundo o proprio obejto
-        # ramo
-        indice_prioridades_dict[id(ramo)] = (
-            float(soma_prioridades)/float(len(ramo[0].keys())), 
-            ramo
-        )
-
-    # reorganização da lista ramos de acordo com a prioridade
-    # de cada ramo
-    ramos_2 = []
-    for ramo in ramos:
-        prioridade_max = max(
-            [i[0] for i in indice_prioridades_dict.values()]
-        )
-        # a variavel ramo recebe o objeto ramo de maior prioridade
-        # dentre os existentes no dicionario indice_prioridades_dict
-        ramo = [i[1] for i in indice_prioridades_dict.values()
-         if i[0] == prioridade_max]
-        
-        indice_prioridades_dict.pop(id(ramo[0]))
-        ramos_2.append(ramo[0])
-
-    ramos = ramos_2
-    ramos_2 = []
+def restaurar_ramos(agent, alimentador, subestacao, ramos, por_bisseccao=True):
+    """Tenta restaurar os ramos desenergizados inserindo-os no
+    alimentador, um de cada vez, em ordem de prioridade.
+
+    Os ramos ficam em uma fila de trabalho (EscalonadorDeRamos). Cada
+    tentativa é feita dentro de uma Transacao: o ramo é inserido e, se
+    alguma restrição (potencia dos trafos, carregamento dos condutores,
+    nivel de tensao) for violada, os seus setores mais profundos são
+    podados até que a violação deixe de existir. Se isso não for
+    possível a tentativa é desfeita sem notificar os outros agentes,
+    que só recebem o resultado das tentativas confirmadas. Os ramos que
+    não podem ser inseridos por não fazerem fronteira com o alimentador
+    voltam para a fila sempre que outro ramo é restaurado, pois podem
+    passar a fazer fronteira com o ramo restaurado. Em uma restauração
+    parcial, os setores podados de volta formam ramos menores, que voltam
+    para a fila com a prioridade dos setores que restaram.
+
+    Com por_bisseccao, o número de setores a podar de cada ramo é encontrado
+    por busca binária (eliminar_violacoes_por_bisseccao); sem ela, os
+    setores são podados um de cada vez (eliminar_violacoes).
+    """
+    if por_bisseccao:
+        eliminar = eliminar_violacoes_por_bisseccao
+    else:
+        eliminar = eliminar_violacoes
 
+    escalonador = EscalonadorDeRamos(ramos)
+    adiados = list()
 
-    # armazena a estrtura RNP inicial do alimentador
-    arvore_inicial = Arvore(agent.alimentador.arvore, dtype=str)
-    arvore_inicial.ordenar(agent.alimentador.raiz)
-    rnp_inicial = arvore_inicial.rnp
+    def notificar(tipo, setores):
+        notificar_agentes(agent, tipo, alimentador.nome, setores)
 
-    # inicializa a variável chave_de_isolacao
-    chave_de_isolacao = None
+    while escalonador:
+        ramo = escalonador.retirar()
 
-    # for percorre os ramos afetados tentando a recomposicao de cada um deles!
-    for ramo in ramos:
         # identifica quais setores fazem vizinhança ao alimentador
         # afetado e quais setores deste alimentador fazem vizinhança
         # para que possa ser realizada a inserção
         pares_setores_recomp = identificar_setor_de_insercao(ramo, alimentador)
 
         if pares_setores_recomp == []:
-            ramos_2.append(ramo)
-        else:
-            no, no_raiz, chave = pares_setores_recomp[0]
+            adiados.append(ramo)
+            continue
 
-            # inserção de todo o ramo na arvore do alimentador
-            alimentador.inserir_ramo(no, ramo, no_raiz)
+        no, no_raiz, chave = pares_setores_recomp[0]
+
+        # inserção de todo o ramo na arvore do alimentador, como
+        # tentativa: os outros agentes só são notificados se a
+        # restauração for confirmada
+        # uma exceção durante a tentativa desfaz a transação, de modo que
+        # o alimentador não fica com uma transação aberta
+        with alimentador.iniciar_transacao(notificar) as transacao:
+            transacao.inserir_ramo(no, ramo, no_raiz)
 
             display_message(agent.aid.name, 'Inserção de ramo no alimentador')
             print alimentador.rnp
 
-            # Envia mensagem para atualizar os outros agentes
-            # que também têm uma representação da rede
-            notificar_agentes(agent,
-                              'insercao',
-                              alimentador.nome,
-                              (no, no_raiz))
-
-            # verificação da potencia fornecida pelos transformadores
-            potencia_disponivel = calcular_potencia_disponivel(subestacao)
-
-            display_message(agent.aid.name, 'Potencia disponivel após inserção de ramo: {pot} MVA'.format(
-                pot=potencia_disponivel / 1e6))
-
-            setores_mais_profundos = []
-            setores_analisados = []
-            poda_de_setores = []
-
-            rnp_de_setor = ramo[2]  # 2 : RNP de setor da poda
-            prof = int(max(rnp_de_setor[0, :]))
-
-            setores_ramo = list(rnp_de_setor[1, :])
-            setores_ramo.sort()
-
-            while potencia_disponivel < 0.0:
-                # caso haja violação nas potências dos trafos, o sistema
-                # irá podar os setores de maior profundidade do ramo
-                # inserido até que a violação deixe de existir
-
-                info_poda = podar_setor_mais_profundo(agent,
-                                                      alimentador,
-                                                      setores_analisados,
-                                                      setores_mais_profundos,
-                                                      rnp_de_setor,
-                                                      prof)
-                if info_poda is None:
-                    break
-                else:
-                    (setores_analisados,
-                     setores_mais_profundos,
-                     prof,
-                     poda,
-                     chave_de_isolacao) = info_poda
-                    poda_de_setores.append(poda)
-
-                # atualização da potencia fornecida pelos transformadores
-                potencia_disponivel = calcular_potencia_disponivel(subestacao)
-                display_message(agent.aid.name, 'Potencia disponivel após realizaçao de poda: {pot} MVA'.format(
-                    pot=potencia_disponivel / 1e6))
+            possivel, chave_de_isolacao = eliminar(agent, alimentador, subestacao,
+                                                   transacao, no_raiz)
+
+            # se a estrtura RNP do alimentador foi modificada
+            restaurado = possivel and transacao.alterou()
+            if restaurado:
+                podas = alimentador.confirmar_transacao()
             else:
-                # se não houver violação na potencia
-                # dos trafos a restrição de carregamento
-                # dos condutores  e nível de tensão são verificadas
-
-                subestacao.calcular_fluxo_de_carga()
-                trecho = verificar_carregamento_dos_condutores(agent, subestacao)
-
-                while trecho is not None:
-                    info_poda = podar_setor_mais_profundo(agent,
-                                                          alimentador,
-                                                          setores_analisados,
-                                                          setores_mais_profundos,
-                                                          rnp_de_setor,
-                                                          prof)
-                    (setores_analisados,
-                     setores_mais_profundos,
-                     prof,
-                     poda,
-                     chave_de_isolacao) = info_poda
-
-                    poda_de_setores.append(poda)
-
-                    if info_poda is None:
-                        break
-                    else:
-                        (setores_analisados,
-                         setores_mais_profundos,
-                         prof,
-                         poda,
-                         chave_de_isolacao) = info_poda
-
-                    # calculo de fluxo de carga no alimentador
-                    subestacao.calcular_fluxo_de_carga()
-                    trecho = verificar_carregamento_dos_condutores(agent, subestacao)
-                    if trecho is not None:
-                        display_message(agent.aid.name, 'Trecho {tr} em sobrecarga'.format(tr=trecho))
+                display_message(agent.aid.name, 'Desfazendo a insercao do ramo')
+                alimentador.desfazer_transacao()
 
-                else:
-                    no = verificar_nivel_de_tensao(agent, subestacao)
-
-                    while no is not None:
-                        info_poda = podar_setor_mais_profundo(agent,
-                                                              alimentador,
-                                                              setores_analisados,
-                                                              setores_mais_profundos,
-                                                              rnp_de_setor,
-                                                              prof)
-                        (setores_analisados,
-                         setores_mais_profundos,
-                         prof,
-                         poda,
-                         chave_de_isolacao) = info_poda
-
-                        poda_de_setores.append(poda)
-                        if info_poda is None:
-                            break
-                        else:
-                            (setores_analisados,
-                             setores_mais_profundos,
-                             prof,
-                             poda,
-                             chave_de_isolacao) = info_poda
-                            poda_de_setores.append(poda)
-                        # calculo de fluxo de carga no alimentador
-                        subestacao.calcular_fluxo_de_carga()
-                        no = verificar_nivel_de_tensao(agent, subestacao)
-                        if no is not None:
-                            display_message(agent.aid.name, 'No de carga {no} com' \
-                                                            'violacao de tensao'.format(no=no))
-                # se a estrtura RNP do alimentador foi modificada
-                if not agent.alimentador.rnp.size == rnp_inicial.size:
-                    display_message(agent.aid.name, 'Enviando comando de fechamento para AD...')
-
-                    # # # # # #
-                    # Envia mensagem para AD fechar chave de recomposicao
-                    # TODO: e abrir chave de isolação
-                    # # # # # #
-                    
-                    message = ACLMessage(ACLMessage.REQUEST)
-                    message.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
-                    if chave_de_isolacao is not None:
-                        message.set_content(json.dumps({'ref': 'R_05',
-                                                        'dados': {'chaves': [chave, chave_de_isolacao],
-                                                                  'estados': [1, 0]
-                                                                  }
-                                                        },
-                                                       indent=4)
-                                            )
-                    else:
-                        message.set_content(json.dumps({'ref': 'R_05',
-                                                        'dados': {'chaves': [chave],
-                                                                  'estados': [1]
-                                                                  }
-                                                        },
-                                                       indent=4)
-                                            )
-                    message.add_receiver(agent.agente_dispositivo_aid)
-
-                    # lança comportamento
-                    comp = CompRequest3(agent, message)
-                    agent.behaviours.append(comp)
-                    comp.on_start()
+        if restaurado:
+            if ramo in agent.podas:
+                agent.podas.remove(ramo)
+            agent.podas.extend(podas)
 
-                    display_message(agent.aid.name, 'Recomposição do ramo realizada')
-                    print alimentador.rnp
-                    inserir_ramos_recursivo(agent, alimentador, subestacao, ramos_2)
-                elif trecho is not None:
-                    return
-                elif no is not None:
-                    return
-    return
+            # os ramos podados de volta podem ser inseridos por outra
+            # chave de fronteira
+            for poda in podas:
+                escalonador.atualizar(poda)
+
+            # escreve nos objetos as grandezas do estado confirmado, já
+            # calculadas na verificação das restrições
+            calcular_fluxo_de_carga(subestacao)
+
+            enviar_comando_de_recomposicao(agent, chave, chave_de_isolacao)
+            display_message(agent.aid.name, 'Recomposição do ramo realizada')
+            print alimentador.rnp
+
+            # os ramos adiados podem fazer fronteira com o ramo restaurado
+            for adiado in adiados:
+                escalonador.inserir(adiado)
+            adiados = list()
+
+
+def violacao_de_restricoes(agent, subestacao):
+    """Retorna as violações (Violacao) de potencia dos trafos, de
+    carregamento dos condutores e de nivel de tensao na subestacao, ou
+    uma lista vazia. As restrições de carregamento e de tensão só são
+    verificadas, com o cálculo do fluxo de carga, se não houver violação
+    de potencia. As grandezas calculadas não são escritas nos objetos.
+    """
+    # verificação da potencia fornecida pelos transformadores
+    potencia_disponivel = calcular_potencia_disponivel(subestacao)
+    display_message(agent.aid.name, 'Potencia disponivel: {pot} MVA'.format(
+        pot=potencia_disponivel / 1e6))
+    if potencia_disponivel < 0.0:
+        limite = abs(potencia_dos_trafos(subestacao))
+        return [Violacao('potencia', None, subestacao.nome, None,
+                         limite - potencia_disponivel, limite, potencia_disponivel / limite)]
+    try:
+        resultados = calcular_fluxo_de_carga(subestacao, escrever=False)
+    except LigacaoInexistente as erro:
+        # a rede não é radial e conexa: o estado é inviável
+        display_message(agent.aid.name, str(erro))
+        return [Violacao('conexao', erro.alimentador, erro.nos[1], None,
+                         None, None, float('-inf'))]
+    return (verificar_carregamento_dos_condutores(agent, subestacao, resultados) +
+            verificar_nivel_de_tensao(agent, subestacao, resultados))
+
+
+def minimo_de_setores_podados(alimentador, setores, violacoes):
+    """Limite inferior do número de setores, na ordem de setores, que
+    precisam ser podados para eliminar as violações, a partir do alívio
+    máximo de cada violação obtido com a poda de cada setor
+    """
+    if any(violacao.tipo == 'conexao' for violacao in violacoes):
+        # sem a rede radial não há estimativa do alívio das podas
+        return len(setores)
+
+    rede = rede_radial(alimentador)
+    cargas = rede.cargas(alimentador)
+
+    # posições dos nós de carga de cada setor na rede radial
+    posicoes, setor_do_no = list(), list()
+    for k, setor in enumerate(setores):
+        for no in alimentador.setores[setor].nos_de_carga:
+            posicoes.append(rede.indice[no])
+            setor_do_no.append(k)
+
+    necessarios, alivios_por_setor = list(), list()
+    for violacao in violacoes:
+        if violacao.alimentador not in (None, alimentador.nome):
+            # a poda do ramo não alivia violações em outros alimentadores
+            return len(setores)
+        necessario, alivio = alivios(rede, rede.resultado, cargas, violacao, posicoes)
+        necessarios.append(necessario)
+        alivios_por_setor.append(np.bincount(setor_do_no, weights=alivio,
+                                             minlength=len(setores)))
+    return limite_inferior_de_poda(necessarios, alivios_por_setor)
+
+
+def eliminar_violacoes(agent, alimentador, subestacao, transacao, no_raiz):
+    """Poda os setores mais profundos do ramo inserido a partir de no_raiz,
+    um de cada vez, até que não haja violação de potencia dos trafos, de
+    carregamento dos condutores ou de nivel de tensao. Retorna uma tupla
+    com um booleano que indica se a violação foi eliminada e a chave de
+    isolação da última poda (None se não houve poda).
+    """
+    setores_mais_profundos = []
+    setores_analisados = []
+    chave_de_isolacao = None
+
+    # RNP do ramo, com as profundidades que tem no alimentador
+    rnp_de_setor = alimentador.rnp_inteira[:, alimentador.subarvore(no_raiz)].copy()
+    prof = int(rnp_de_setor[0, :].max())
+
+    # caso haja violação, o sistema irá podar os setores de maior
+    # profundidade do ramo inserido até que a violação deixe de existir
+    while violacao_de_restricoes(agent, subestacao):
+        info_poda = podar_setor_mais_profundo(agent,
+                                              alimentador,
+                                              setores_analisados,
+                                              setores_mais_profundos,
+                                              rnp_de_setor,
+                                              prof,
+                                              transacao)
+        if info_poda is None:
+            return False, None
+
+        (setores_analisados,
+         setores_mais_profundos,
+         prof,
+         poda,
+         chave_de_isolacao) = info_poda
+
+    return True, chave_de_isolacao
+
+
+def eliminar_violacoes_por_bisseccao(agent, alimentador, subestacao, transacao, no_raiz):
+    """Mesmo resultado de eliminar_violacoes, com busca binária sobre o
+    número de setores podados.
+
+    Os setores do ramo inserido são ordenados do mais profundo para o
+    menos profundo, de modo que podar os k primeiros sempre poda apenas
+    folhas. Como podar mais setores nunca agrava as violações, o menor k
+    que elimina as violações é encontrado com O(log n) cálculos de fluxo
+    de carga, indo e voltando entre os estados por meio da transação.
+
+    Isso só vale para estados em que a rede é radial e conexa: se algum
+    estado avaliado tiver violação de conexão, ou se a poda ou a inserção
+    necessária para chegar a ele falhar, as podas feitas pela busca são
+    desfeitas e o resultado é o de eliminar_violacoes.
+    """
+    violacoes = violacao_de_restricoes(agent, subestacao)
+    if not violacoes:
+        return True, None
+    if any(violacao.tipo == 'conexao' for violacao in violacoes):
+        return eliminar_violacoes(agent, alimentador, subestacao, transacao, no_raiz)
+
+    # setores do ramo, do mais profundo para o menos profundo
+    rnp_de_setor = alimentador.rnp_inteira[:, alimentador.subarvore(no_raiz)]
+    ordem = np.argsort(-rnp_de_setor[0, :], kind='mergesort')
+    setores = nomes_dos_setores(rnp_de_setor[1, ordem])
+
+    # podar menos setores que o limite inferior obtido das violações
+    # certamente não as elimina, e esses estados não são avaliados
+    inicio = minimo_de_setores_podados(alimentador, setores, violacoes) - 1
+
+    # as podas da busca são as operações registradas na transação
+    # depois da marca
+    marca = transacao.marca()
+    estado = {'sequencial': False}
+
+    def podados():
+        return transacao.marca() - marca
+
+    def podar(k):
+        # leva o alimentador ao estado com os k primeiros setores podados;
+        # retorna False se as árvores da rede (rnp.Arvore) não permitirem
+        # chegar a esse estado, caso em que a busca deixa de valer
+        try:
+            if k < podados():
+                transacao.desfazer(ate=marca + k)
+            for setor in setores[podados():k]:
+                display_message(agent.aid.name, 'Poda do setor: {setor}'.format(setor=setor))
+                transacao.podar(setor)
+        except (KeyError, IndexError, OperacaoInconsistente):
+            estado['sequencial'] = True
+            return False
+        return True
+
+    def viavel(k):
+        if estado['sequencial'] or not podar(k):
+            # os demais estados não precisam ser avaliados
+            return True
+        violacoes = violacao_de_restricoes(agent, subestacao)
+        if any(violacao.tipo == 'conexao' for violacao in violacoes):
+            estado['sequencial'] = True
+        return not violacoes
+
+    k = bisseccao(len(setores), viavel, inicio)
+    if not estado['sequencial'] and k < len(setores) and podados() != k:
+        podar(k)
+    if estado['sequencial']:
+        # as violações não são monótonas em k: busca sequencial a partir
+        # do ramo inserido
+        transacao.desfazer(ate=marca)
+        return eliminar_violacoes(agent, alimentador, subestacao, transacao, no_raiz)
+
+    # podar todos os setores equivale a não restaurar o ramo
+    if k == len(setores):
+        display_message(agent.aid.name, 'A recomposicao do ramo nao foi possivel!')
+        return False, None
+
+    return True, encontrar_chave_de_isolacao(alimentador, setores[k - 1])
+
+
+def enviar_comando_de_recomposicao(agent, chave, chave_de_isolacao):
+    display_message(agent.aid.name, 'Enviando comando de fechamento para AD...')
+
+    # # # # # #
+    # Envia mensagem para AD fechar chave de recomposicao
+    # e abrir chave de isolação
+    # # # # # #
+
+    message = ACLMessage(ACLMessage.REQUEST)
+    message.set_protocol(ACLMessage.FIPA_REQUEST_PROTOCOL)
+    if chave_de_isolacao is not None:
+        message.set_content(json.dumps({'ref': 'R_05',
+                                        'dados': {'chaves': [chave, chave_de_isolacao],
+                                                  'estados': [1, 0]
+                                                  }
+                                        },
+                                       indent=4)
+                            )
+    else:
+        message.set_content(json.dumps({'ref': 'R_05',
+                                        'dados': {'chaves': [chave],
+                                                  'estados': [1]
+                                                  }
+                                        },
+                                       indent=4)
+                            )
+    message.add_receiver(agent.agente_dispositivo_aid)
+
+    # lança comportamento
+    comp = CompRequest3(agent, message)
+    agent.behaviours.append(comp)
+    comp.on_start()
 
 
 if __name__ == "__main__":
@@ -8,7 +8,6 @@ from pade.acl.aid import AID
 from pade.behaviours.protocols import FipaRequestProtocol
 
 import json
-import numpy as np
 
 import iec61850
 #
@@ -32,7 +31,12 @@ class CompRequest1(FipaRequestProtocol):
     def __init__(self, agent):
         super(CompRequest1, self).__init__(
             agent=agent, message=None, is_initiator=False)
-        self.alimentador = self.agent.agente_alimentador.alimentador
+
+    @property
+    def alimentador(self):
+        # lido a cada acesso, pois o alimentador do agente AA e
+        # substituido quando a topologia e recarregada
+        return self.agent.agente_alimentador.alimentador
 
     def handle_request(self, message):
 
@@ -81,9 +85,8 @@ class CompRequest1(FipaRequestProtocol):
         chave = self.alimentador.chaves[str(chave_nome)]
         setor_1 = chave.n1
         setor_2 = chave.n2
-        rnp = self.alimentador.rnp_dic()
-        prof_1 = rnp[setor_1.nome]
-        prof_2 = rnp[setor_2.nome]
+        prof_1 = self.alimentador.profundidade(setor_1.nome)
+        prof_2 = self.alimentador.profundidade(setor_2.nome)
         if prof_1 > prof_2:
             return setor_1.nome
         else:
@@ -91,17 +94,11 @@ class CompRequest1(FipaRequestProtocol):
 
     def encontrar_chaves_de_isolacao(self):
         setor_sob_falta = self.encontrar_setor_sob_falta()
-        rnp = self.alimentador.rnp_dic()
-        prof = rnp[setor_sob_falta]
-        setores_adjacentes = list()
-        for i in range(np.size(self.alimentador.rnp, axis=1)):
-            if int(self.alimentador.rnp[0, i]) == (int(prof) + 1):
-                setores_adjacentes.append(self.alimentador.rnp[1, i])
 
         chaves_de_isolacao = list()
-        for chave in self.alimentador.chaves.values():
-            if (chave.n1.nome or chave.n2.nome) == setor_sob_falta:
-                chaves_de_isolacao.append(chave.nome)
+        for chave in self.alimentador.chaves_do_setor(setor_sob_falta):
+            if self.alimentador.chaves[chave].n1.nome == setor_sob_falta:
+                chaves_de_isolacao.append(chave)
 
         return chaves_de_isolacao
 
@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+
+"""
+Alimentador com índices mantidos incrementalmente sobre a RNP.
+
+O AlimentadorIndexado é um rede.Alimentador cujos índices derivados da
+RNP e das chaves (profundidade de cada setor e chaves de cada setor) são
+construídos uma única vez e atualizados por podar e inserir_ramo com
+custo proporcional ao ramo movido, em vez de serem reconstruídos a cada
+consulta. Qualquer outra atribuição a rnp invalida o índice de
+profundidades; alterações feitas diretamente em chaves devem ser
+seguidas de invalidar_indices.
+
+A RNP também é mantida na forma inteira (rnp_inteira): uma matriz 2 x n
+de int32 com a profundidade na linha 0 e o identificador do setor na
+linha 1. Os identificadores vêm da tabela TABELA_SETORES, única por
+processo, de modo que ramos podados de um alimentador e inseridos em
+outro mantêm os mesmos identificadores. Como os identificadores
+dependem do processo, a RNP inteira não é serializada.
+
+A RNP inteira fica em um buffer pré-alocado com folga: podar desloca as
+colunas seguintes ao ramo podado sobre ele e inserir_ramo as desloca
+para abrir espaço ao ramo, sem realocar o buffer.
+
+A carga (soma das potências dos nós de carga, complexa, em VA) de cada
+setor e a do alimentador (potencia_total) também são mantidas: podar
+subtrai a carga dos setores do ramo e inserir_ramo soma a dos setores
+inseridos, sem percorrer os demais. Alterações nas potências dos nós de
+carga devem ser seguidas de invalidar_potencias.
+
+podar e inserir_ramo são feitas por completo ou não são feitas: se a
+operação de rede.Alimentador falhar no meio, ou se o resultado não
+corresponder ao ramo (OperacaoInconsistente: inserir_ramo sem chave de
+fronteira entre o ramo e o setor de inserção, poda de setores fora do
+ramo), o alimentador volta ao estado anterior (salvar_estado e
+restaurar_estado, cópias rasas dos dicionários e das árvores) e a
+exceção é repassada.
+
+As consultas sobre a RNP inteira (subarvore, filhos, setores_na_profundidade
+e caminho_ate_raiz) usam o fato de que, na RNP, a subárvore de um setor
+ocupa colunas contíguas a partir da coluna do setor, e retornam faixas ou
+vetores de colunas, sem montar listas de nomes. nomes_dos_setores
+converte colunas em nomes quando necessário.
+"""
+
+import numpy as np
+
+from rede import Alimentador
+from restauracao import Transacao
+
+
+class TabelaDeNomes(object):
+    """Tabela nome <-> identificador inteiro, com identificadores
+    atribuídos na ordem em que os nomes são vistos pela primeira vez
+    """
+
+    def __init__(self):
+        self.nomes = list()
+        self.ids = dict()
+
+    def id(self, nome):
+        try:
+            return self.ids[nome]
+        except KeyError:
+            self.ids[nome] = len(self.nomes)
+            self.nomes.append(nome)
+            return self.ids[nome]
+
+    def codificar(self, nomes):
+        return np.fromiter((self.id(str(nome)) for nome in nomes), dtype=np.int32)
+
+    def decodificar(self, ids):
+        return [self.nomes[i] for i in ids]
+
+
+TABELA_SETORES = TabelaDeNomes()
+
+
+def codificar_rnp(rnp):
+    """Converte uma RNP de strings (profundidade, setor) na RNP inteira"""
+    rnp_inteira = np.empty((2, rnp.shape[1]), dtype=np.int32)
+    rnp_inteira[0, :] = rnp[0, :].astype(np.int32)
+    rnp_inteira[1, :] = TABELA_SETORES.codificar(rnp[1, :])
+    return rnp_inteira
+
+
+def nomes_dos_setores(ids):
+    return TABELA_SETORES.decodificar(ids)
+
+
+class Poda(object):
+    """Ramo podado de um alimentador.
+
+    Os campos são os elementos da tupla retornada por
+    rede.Alimentador.podar, na mesma ordem (CAMPOS), e continuam acessíveis
+    por índice para o rede.Alimentador.inserir_ramo. Também são guardados
+    agregados calculados uma única vez ao criar a poda:
+
+        raiz: setor raiz do ramo
+        numero_de_setores, soma_prioridades, prioridade_media
+        carga_total: soma das potências dos nós de carga, complexa, em VA
+        chaves_de_fronteira: chaves do ramo que o ligam a outros setores
+
+    resumo() retorna uma forma compacta do ramo, em tipos JSON, usada nas
+    mensagens entre agentes.
+    """
+
+    CAMPOS = ('setores', 'arvore_setores', 'rnp_setores',
+              'nos_de_carga', 'arvore_nos_de_carga', 'rnp_nos_de_carga',
+              'chaves', 'trechos')
+
+    AGREGADOS = ('raiz', 'numero_de_setores', 'soma_prioridades',
+                 'carga_total', 'chaves_de_fronteira')
+
+    __slots__ = CAMPOS + AGREGADOS
+
+    def __init__(self, poda):
+        for campo, valor in zip(self.CAMPOS, poda):
+            setattr(self, campo, valor)
+        self.atualizar_agregados()
+
+    def atualizar_agregados(self):
+        self.raiz = str(self.rnp_setores[1, 0])
+        self.numero_de_setores = len(self.setores)
+        self.soma_prioridades = sum(setor.prioridade for setor in self.setores.values())
+        self.carga_total = sum((complex(no.potencia.real, no.potencia.imag)
+                                for no in self.nos_de_carga.values()), 0j)
+        self.chaves_de_fronteira = sorted(
+            nome for nome, chave in self.chaves.items()
+            if chave.n1.nome not in self.setores or chave.n2.nome not in self.setores)
+
+    @property
+    def prioridade_media(self):
+        return float(self.soma_prioridades) / self.numero_de_setores
+
+    def substituir(self, outra):
+        """Passa a representar o ramo de outra Poda, mantendo a identidade
+        do objeto, que pode estar em listas de podas dos agentes
+        """
+        self.__setstate__(outra.__getstate__())
+
+    def __getitem__(self, indice):
+        return getattr(self, self.CAMPOS[indice])
+
+    def __iter__(self):
+        return (getattr(self, campo) for campo in self.CAMPOS)
+
+    def __len__(self):
+        return len(self.CAMPOS)
+
+    def __getstate__(self):
+        return tuple(getattr(self, campo) for campo in self.CAMPOS + self.AGREGADOS)
+
+    def __setstate__(self, estado):
+        for campo, valor in zip(self.CAMPOS + self.AGREGADOS, estado):
+            setattr(self, campo, valor)
+
+    def resumo(self):
+        return {'raiz': self.raiz,
+                'setores': list(self.rnp_setores[1, :]),
+                'chaves_de_fronteira': self.chaves_de_fronteira,
+                'numero_de_setores': self.numero_de_setores,
+                'soma_prioridades': self.soma_prioridades,
+                'carga_total': [self.carga_total.real, self.carga_total.imag]}
+
+    def __repr__(self):
+        return '<Poda %s: %d setores, %.1f kVA>' % (self.raiz, self.numero_de_setores,
+                                                    abs(self.carga_total) / 1e3)
+
+
+def potencia_do_setor(setor):
+    return sum((complex(no.potencia.real, no.potencia.imag)
+                for no in setor.nos_de_carga.values()), 0j)
+
+
+def subarvore(rnp_inteira, coluna):
+    """Faixa de colunas da subárvore do setor na coluna informada"""
+    profundidades = rnp_inteira[0, coluna + 1:]
+    fora = np.flatnonzero(profundidades <= rnp_inteira[0, coluna])
+    fim = coluna + 1 + (fora[0] if fora.size else profundidades.size)
+    return slice(coluna, fim)
+
+
+def filhos(rnp_inteira, coluna):
+    """Colunas dos setores filhos do setor na coluna informada"""
+    faixa = subarvore(rnp_inteira, coluna)
+    return coluna + 1 + np.flatnonzero(
+        rnp_inteira[0, coluna + 1:faixa.stop] == rnp_inteira[0, coluna] + 1)
+
+
+def setores_na_profundidade(rnp_inteira, profundidade):
+    """Colunas dos setores com a profundidade informada"""
+    return np.flatnonzero(rnp_inteira[0, :] == profundidade)
+
+
+def caminho_ate_raiz(rnp_inteira, coluna):
+    """Colunas dos setores no caminho do setor na coluna informada até a
+    raiz, começando pelo próprio setor
+    """
+    # percorrendo a RNP de trás para frente a partir do setor, cada
+    # ancestral é a primeira coluna com profundidade menor que a de
+    # todas as colunas anteriores
+    profundidades = rnp_inteira[0, coluna::-1]
+    minimo = np.minimum.accumulate(profundidades)
+    ancestral = np.empty(profundidades.size, dtype=bool)
+    ancestral[0] = True
+    ancestral[1:] = profundidades[1:] < minimo[:-1]
+    return coluna - np.flatnonzero(ancestral)
+
+
+class OperacaoInconsistente(ValueError):
+    """rede.Alimentador.podar ou inserir_ramo não alterou o alimentador
+    como esperado. O alimentador já foi restaurado ao estado anterior à
+    operação.
+    """
+
+
+def copiar_arvore(arvore):
+    """Cópia do dicionário nó -> vizinhos de uma rnp.Arvore, com as
+    listas de vizinhos copiadas
+    """
+    return dict((no, list(vizinhos)) for no, vizinhos in arvore.items())
+
+
+class AlimentadorIndexado(Alimentador):
+
+    # transação em andamento (restauracao.Transacao), se houver
+    transacao = None
+
+    def __init__(self, *args, **kwargs):
+        self._profundidades = None
+        self._chaves_por_setor = None
+        self._potencias_dos_setores = None
+        self._potencia_total = 0j
+        self._buffer = None
+        self._colunas = 0
+        super(AlimentadorIndexado, self).__init__(*args, **kwargs)
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        estado['_buffer'] = None
+        estado.pop('transacao', None)
+        return estado
+
+    def iniciar_transacao(self, notificar=None):
+        """Inicia uma transação: as podas e inserções feitas por meio
+        dela podem ser confirmadas (confirmar_transacao) ou desfeitas
+        (desfazer_transacao)
+        """
+        if self.transacao is not None:
+            raise RuntimeError('Transacao ja iniciada no alimentador %s' % self.nome)
+        self.transacao = Transacao(self, notificar)
+        return self.transacao
+
+    def confirmar_transacao(self):
+        transacao, self.transacao = self.transacao, None
+        return transacao.confirmar()
+
+    def desfazer_transacao(self):
+        transacao, self.transacao = self.transacao, None
+        transacao.desfazer()
+
+    def salvar_estado(self):
+        """Cópia rasa do que podar e inserir_ramo alteram no alimentador:
+        RNP, árvores de setores e de nós de carga, dicionários de setores,
+        nós de carga, chaves e trechos e estados das chaves. Os objetos
+        não são copiados. restaurar_estado volta a esse estado.
+        """
+        arvore_nos = self.__dict__.get('arvore_nos_de_carga')
+        if arvore_nos is not None:
+            arvore_nos = (arvore_nos, arvore_nos.rnp, copiar_arvore(arvore_nos.arvore))
+        estado = dict((atributo, dict(getattr(self, atributo)))
+                      for atributo in ('setores', 'nos_de_carga', 'chaves', 'trechos'))
+        estado.update(rnp=self.rnp,
+                      arvore=copiar_arvore(self.arvore),
+                      arvore_nos_de_carga=arvore_nos,
+                      estados_das_chaves=[(chave, chave.estado) for chave in self.chaves.values()])
+        return estado
+
+    def restaurar_estado(self, estado):
+        for atributo in ('setores', 'nos_de_carga', 'chaves', 'trechos'):
+            elementos = getattr(self, atributo)
+            elementos.clear()
+            elementos.update(estado[atributo])
+        for chave, estado_da_chave in estado['estados_das_chaves']:
+            chave.estado = estado_da_chave
+        self.arvore = copiar_arvore(estado['arvore'])
+        if estado['arvore_nos_de_carga'] is not None:
+            arvore_nos, rnp, arvore = estado['arvore_nos_de_carga']
+            arvore_nos.rnp, arvore_nos.arvore = rnp, copiar_arvore(arvore)
+            self.arvore_nos_de_carga = arvore_nos
+        self.rnp = estado['rnp']
+        self.invalidar_indices()
+
+    def invalidar_indices(self):
+        self._profundidades = None
+        self._chaves_por_setor = None
+        self._buffer = None
+        self.invalidar_potencias()
+
+    def invalidar_potencias(self):
+        self._potencias_dos_setores = None
+
+    @property
+    def rnp(self):
+        return self.__dict__.get('_rnp')
+
+    @rnp.setter
+    def rnp(self, rnp):
+        self._rnp = rnp
+        self._profundidades = None
+        self._buffer = None
+
+    @property
+    def rnp_inteira(self):
+        """RNP com profundidades e identificadores de setor inteiros,
+        como visão das colunas ocupadas do buffer
+        """
+        if self._buffer is None:
+            rnp_inteira = codificar_rnp(self.rnp)
+            self._colunas = rnp_inteira.shape[1]
+            self._buffer = np.empty((2, max(2 * self._colunas, 16)), dtype=np.int32)
+            self._buffer[:, :self._colunas] = rnp_inteira
+        return self._buffer[:, :self._colunas]
+
+    def _reservar(self, colunas):
+        if colunas > self._buffer.shape[1]:
+            buffer = np.empty((2, 2 * colunas), dtype=np.int32)
+            buffer[:, :self._colunas] = self._buffer[:, :self._colunas]
+            self._buffer = buffer
+
+    @property
+    def profundidades(self):
+        """Dicionário setor -> profundidade (int) na RNP do alimentador"""
+        if self._profundidades is None:
+            rnp = self.rnp
+            self._profundidades = dict(
+                (str(nome), int(prof)) for prof, nome in zip(rnp[0, :], rnp[1, :]))
+        return self._profundidades
+
+    def profundidade(self, setor):
+        return self.profundidades[setor]
+
+    def coluna(self, setor):
+        """Coluna do setor na RNP do alimentador"""
+        rnp_inteira = self.rnp_inteira
+        colunas = np.flatnonzero(rnp_inteira[1, :] == TABELA_SETORES.ids.get(setor, -1))
+        if not colunas.size:
+            raise KeyError(setor)
+        return int(colunas[0])
+
+    def nomes(self, colunas):
+        """Nomes dos setores nas colunas (faixa ou vetor) da RNP"""
+        return nomes_dos_setores(self.rnp_inteira[1, colunas])
+
+    def subarvore(self, setor):
+        return subarvore(self.rnp_inteira, self.coluna(setor))
+
+    def filhos(self, setor):
+        return filhos(self.rnp_inteira, self.coluna(setor))
+
+    def setores_na_profundidade(self, profundidade):
+        return setores_na_profundidade(self.rnp_inteira, profundidade)
+
+    def caminho_ate_raiz(self, setor):
+        return caminho_ate_raiz(self.rnp_inteira, self.coluna(setor))
+
+    @property
+    def chaves_por_setor(self):
+        """Dicionário setor -> conjunto dos nomes das chaves do
+        alimentador ligadas ao setor, inclusive as chaves de fronteira
+        com setores de outros alimentadores
+        """
+        if self._chaves_por_setor is None:
+            indice = dict()
+            for chave in self.chaves.values():
+                indice.setdefault(chave.n1.nome, set()).add(chave.nome)
+                indice.setdefault(chave.n2.nome, set()).add(chave.nome)
+            self._chaves_por_setor = indice
+        return self._chaves_por_setor
+
+    def chaves_do_setor(self, setor):
+        return sorted(self.chaves_por_setor.get(setor, ()))
+
+    def _atualizar_chaves_por_setor(self, chaves):
+        # as chaves movidas por podar ou inserir_ramo entram ou saem do
+        # índice conforme estejam ou não no alimentador após a operação
+        indice = self._chaves_por_setor
+        if indice is None:
+            return
+        for nome, chave in chaves.items():
+            for setor in (chave.n1.nome, chave.n2.nome):
+                if nome in self.chaves:
+                    indice.setdefault(setor, set()).add(nome)
+                elif setor in indice:
+                    indice[setor].discard(nome)
+
+    def _calcular_potencias(self):
+        self._potencias_dos_setores = dict(
+            (nome, potencia_do_setor(setor)) for nome, setor in self.setores.items())
+        self._potencia_total = sum(self._potencias_dos_setores.values(), 0j)
+
+    @property
+    def potencias_dos_setores(self):
+        """Dicionário setor -> carga do setor (complexa, em VA)"""
+        if self._potencias_dos_setores is None:
+            self._calcular_potencias()
+        return self._potencias_dos_setores
+
+    @property
+    def potencia_total(self):
+        """Carga total do alimentador (complexa, em VA), equivalente a
+        calcular_potencia sem percorrer os nós de carga
+        """
+        if self._potencias_dos_setores is None:
+            self._calcular_potencias()
+        return self._potencia_total
+
+    def _atualizar_potencias(self, setores, sinal):
+        # soma (sinal 1) ou subtrai (sinal -1) a carga dos setores movidos
+        potencias = self._potencias_dos_setores
+        if potencias is None:
+            return
+        for nome, setor in setores.items():
+            if sinal > 0:
+                potencias[nome] = potencia = potencia_do_setor(setor)
+            else:
+                potencia = potencias.pop(nome, 0j)
+            self._potencia_total += sinal * potencia
+
+    def podar(self, setor, alterar_rnp=False):
+        if not alterar_rnp:
+            return super(AlimentadorIndexado, self).podar(setor, alterar_rnp)
+
+        profundidades = self._profundidades
+        faixa = self.subarvore(setor)
+        buffer, n = self._buffer, self._colunas
+
+        # a poda é feita por completo ou não é feita: se
+        # rede.Alimentador.podar falhar no meio, o alimentador volta ao
+        # estado anterior
+        estado = self.salvar_estado()
+        try:
+            poda = Poda(super(AlimentadorIndexado, self).podar(setor, alterar_rnp))
+            # rnp.Arvore.podar compara as profundidades como texto ('10' <
+            # '9') e pode podar setores ou nós de carga a mais ou a menos
+            if poda.rnp_setores.shape[1] != faixa.stop - faixa.start or \
+               set(poda.rnp_nos_de_carga[1, :]) != set(poda.nos_de_carga):
+                raise OperacaoInconsistente(
+                    'A poda do setor %s nao corresponde ao ramo do setor no alimentador %s'
+                    % (setor, self.nome))
+        except Exception:
+            self.restaurar_estado(estado)
+            raise
+
+        if profundidades is not None:
+            for nome in poda.rnp_setores[1, :]:
+                profundidades.pop(str(nome), None)
+            self._profundidades = profundidades
+
+        # as colunas seguintes ao ramo são deslocadas sobre ele
+        # no próprio buffer
+        k = faixa.stop - faixa.start
+        buffer[:, faixa.start:n - k] = buffer[:, faixa.stop:n]
+        self._buffer, self._colunas = buffer, n - k
+
+        self._atualizar_chaves_por_setor(poda.chaves)
+        self._atualizar_potencias(poda.setores, -1)
+        return poda
+
+    def inserir_ramo(self, setor, poda, no_raiz=None):
+        profundidades = self._profundidades
+        coluna = self.coluna(setor)
+        buffer, n = self._buffer, self._colunas
+
+        # as chaves de fronteira do ramo que o alimentador já possui podem
+        # ser outros objetos (o ramo vem da cópia de outro alimentador) e
+        # são identificadas pelo nome: o alimentador mantém as suas, que
+        # rede.Alimentador.inserir_ramo fecha antes de acrescentar as
+        # chaves do ramo. A árvore de setores do ramo é copiada, pois
+        # rede.Alimentador.inserir_ramo altera as suas listas, de modo que
+        # a poda continua válida depois da inserção
+        ramo = list(poda)
+        indice = Poda.CAMPOS.index('chaves')
+        ramo[indice] = dict((nome, self.chaves.get(nome, chave))
+                            for nome, chave in ramo[indice].items())
+        indice = Poda.CAMPOS.index('arvore_setores')
+        ramo[indice] = copiar_arvore(ramo[indice])
+
+        # a inserção é feita por completo ou não é feita; sem chave de
+        # fronteira entre o ramo e o setor, rede.Alimentador.inserir_ramo
+        # retorna sem inserir o ramo
+        estado = self.salvar_estado()
+        try:
+            super(AlimentadorIndexado, self).inserir_ramo(setor, ramo, no_raiz)
+            if self.rnp.shape[1] != estado['rnp'].shape[1] + poda.rnp_setores.shape[1] or \
+               self.arvore_nos_de_carga.rnp.shape[1] != len(self.nos_de_carga):
+                raise OperacaoInconsistente(
+                    'O ramo %s nao foi inserido por completo no setor %s do alimentador %s'
+                    % (poda.raiz, setor, self.nome))
+        except Exception:
+            self.restaurar_estado(estado)
+            raise
+
+        # as profundidades e a ordem dos setores do ramo inserido dependem
+        # do ponto de inserção e da nova raiz do ramo, por isso são lidas
+        # da RNP; o ramo é inserido logo após a coluna do setor de inserção
+        rnp = self.rnp
+        k = poda.rnp_setores.shape[1]
+        colunas = slice(coluna + 1, coluna + 1 + k)
+        if not all(str(nome) in poda.setores for nome in rnp[1, colunas]):
+            # inserção em outra posição: os índices são reconstruídos
+            colunas = np.in1d(rnp[1, :], poda.rnp_setores[1, :])
+            buffer = None
+
+        if profundidades is not None:
+            for prof, nome in zip(rnp[0, colunas], rnp[1, colunas]):
+                profundidades[str(nome)] = int(prof)
+            self._profundidades = profundidades
+
+        if buffer is not None:
+            self._buffer, self._colunas = buffer, n
+            self._reservar(n + k)
+            buffer = self._buffer
+            buffer[:, colunas.stop:n + k] = buffer[:, coluna + 1:n]
+            buffer[:, colunas] = codificar_rnp(rnp[:, colunas])
+            self._colunas = n + k
+
+        self._atualizar_chaves_por_setor(poda.chaves)
+        self._atualizar_potencias(poda.setores, 1)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de carregamento da topologia.
+
+Gera redes sintéticas (gerador_rede) de 1k a 100k nós de carga, mede o tempo de
+carregar_topologia para cada uma e imprime o tempo por nó, que deve
+permanecer aproximadamente constante se o carregamento for linear.
+
+O tamanho dos alimentadores é fixo e a rede cresce em número de
+subestações. As árvores de cada alimentador são ordenadas pela
+biblioteca rede (Arvore.ordenar) com uma busca recursiva, de custo
+quadrático no número de nós do alimentador, que excede o limite de
+recursão do Python em alimentadores com alguns milhares de nós. Com
+alimentadores de tamanho fixo, o tempo por nó mede apenas o carregamento.
+
+Uso:
+    python benchmark_carregamento.py [--leitor bs4|iterparse] [n_nos ...]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from gerador_rede import gerar_rede
+from xml2objects import carregar_topologia, descartar_documentos
+
+TAMANHOS = [1000, 3000, 10000, 30000, 100000]
+
+# 100 nós de carga por alimentador e 1000 por subestação
+ALIMENTADORES = 10
+SETORES = 10
+NOS = 10
+
+
+def medir(n_nos, leitor):
+    descritor, arquivo = tempfile.mkstemp(suffix='.xml')
+    os.close(descritor)
+    try:
+        contagem = gerar_rede(arquivo,
+                              subestacoes=max(1, n_nos // (ALIMENTADORES * SETORES * NOS)),
+                              alimentadores=ALIMENTADORES,
+                              setores=SETORES,
+                              nos=NOS,
+                              densidade_na=0.1,
+                              semente=0)
+
+        # as mensagens impressas pelo carregamento não entram na medição
+        saida, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            inicio = time.time()
+            carregar_topologia(arquivo, leitor=leitor, snapshot=False)
+            duracao = time.time() - inicio
+        finally:
+            sys.stdout.close()
+            sys.stdout = saida
+    finally:
+        # o documento do arquivo temporário não é mais usado
+        descartar_documentos(arquivo)
+        os.remove(arquivo)
+    # os setores raiz também têm nós de carga
+    return contagem['nos'], duracao
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--leitor', default='bs4', choices=['bs4', 'iterparse'])
+    parser.add_argument('tamanhos', nargs='*', type=int, default=TAMANHOS)
+    args = parser.parse_args()
+
+    print '%10s %12s %16s' % ('nos', 'tempo (s)', 'tempo/no (us)')
+    for tamanho in args.tamanhos:
+        n_nos, duracao = medir(tamanho, args.leitor)
+        print '%10d %12.3f %16.2f' % (n_nos, duracao, 1e6 * duracao / n_nos)
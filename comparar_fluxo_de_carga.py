@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compara o fluxo de carga vetorizado (fluxo_de_carga) com o da biblioteca rede.
+
+Para rede_2.xml e para uma rede sintética (gerador_rede), calcula o fluxo
+de carga de cada subestação com Subestacao.calcular_fluxo_de_carga e com
+fluxo_de_carga.calcular_fluxo_de_carga e imprime, por alimentador, a maior
+diferença entre as tensões dos nós de carga (em pu da tensão da raiz) e
+as perdas calculadas pelos dois métodos e, por subestação, o menor tempo
+de cada um entre as repetições. Para separar a diferença entre os métodos
+do erro de cada um, também é impresso o resíduo das tensões de cada
+método: a maior diferença, em pu, entre as tensões calculadas e as
+obtidas aplicando a elas uma varredura (correntes de carga, correntes nos
+trechos e quedas a partir da raiz).
+
+Os dois métodos usam as mesmas impedâncias: o vetorizado as calcula como
+Trecho.calcula_impedancia, multiplicando o comprimento dos trechos pela
+resistência e reatância dos condutores, e a rede é calculada sem
+alterações. Subestacao.calcular_fluxo_de_carga parte sempre de 13.8 kV,
+a tensão secundária dos transformadores das duas redes comparadas. O
+fluxo de carga da rede converge com tolerância de 1 mV e o vetorizado
+com a tolerância de fluxo_de_carga.TOLERANCIA.
+
+Uso:
+    python comparar_fluxo_de_carga.py [--setores N] [--nos N] [--repeticoes N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from fluxo_de_carga import RAIZ_DE_3, calcular_fluxo_de_carga, rede_radial
+from gerador_rede import gerar_rede
+from xml2objects import ARQUIVO_PADRAO, carregar_topologia, descartar_documentos
+
+
+def carregar(arquivo):
+    # as mensagens impressas pelo carregamento não interessam aqui
+    saida, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        return carregar_topologia(arquivo, leitor='iterparse', snapshot=False)
+    finally:
+        sys.stdout.close()
+        sys.stdout = saida
+
+
+def fluxo_da_rede(subestacao, repeticoes):
+    # menor tempo de Subestacao.calcular_fluxo_de_carga e, por
+    # alimentador, as tensões dos nós e as correntes nas ligações na
+    # ordem da RedeRadial
+    saida, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.time()
+            subestacao.calcular_fluxo_de_carga()
+            tempos.append(time.time() - inicio)
+    finally:
+        sys.stdout.close()
+        sys.stdout = saida
+
+    resultados = dict()
+    for nome, alimentador in subestacao.alimentadores.items():
+        rede = rede_radial(alimentador)
+        nos, trechos = alimentador.nos_de_carga, alimentador.trechos
+        tensoes = np.array([complex(nos[no].tensao.real, nos[no].tensao.imag)
+                            for no in rede.nomes])
+        correntes = np.zeros(len(rede.nomes), dtype=np.complex128)
+        for i, nomes_trechos in enumerate(rede.trechos):
+            if nomes_trechos:
+                fluxo = trechos[nomes_trechos[0]].fluxo
+                correntes[i] = complex(fluxo.real, fluxo.imag)
+        resultados[nome] = (tensoes, correntes)
+    return min(tempos), resultados
+
+
+def fluxo_vetorizado(subestacao, repeticoes):
+    # menor tempo de fluxo_de_carga.calcular_fluxo_de_carga, com as
+    # RedesRadiais já em cache e sem partir do resultado anterior
+    calcular_fluxo_de_carga(subestacao, incremental=False)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.time()
+        resultados = calcular_fluxo_de_carga(subestacao, incremental=False)
+        tempos.append(time.time() - inicio)
+    return min(tempos), resultados
+
+
+def perdas(rede, correntes):
+    # perdas trifásicas nas ligações, em W
+    return 3.0 * np.dot(rede.impedancia.real, np.abs(correntes) ** 2)
+
+
+def residuo(rede, cargas, tensoes):
+    # maior diferença, em pu, entre as tensões e as obtidas de uma
+    # varredura a partir delas
+    correntes = rede.correntes_nos_trechos(np.conj(cargas / (RAIZ_DE_3 * tensoes))).copy()
+    quedas = rede.quedas_acumuladas(RAIZ_DE_3 * rede.impedancia * correntes)
+    return np.max(np.abs(tensoes[0] - quedas - tensoes)) / abs(tensoes[0])
+
+
+def comparar(descricao, topologia, repeticoes):
+    print descricao
+    print '%12s %6s %12s %12s %12s %14s %14s' % (
+        'alimentador', 'nos', 'max dV (pu)', 'res. rede', 'res. vet.',
+        'perdas rede', 'perdas vet.')
+    for nome_sub, subestacao in sorted(topologia['subestacoes'].items()):
+        tempo_rede, da_rede = fluxo_da_rede(subestacao, repeticoes)
+        tempo_vetorizado, vetorizados = fluxo_vetorizado(subestacao, repeticoes)
+
+        for nome, alimentador in sorted(subestacao.alimentadores.items()):
+            rede = rede_radial(alimentador)
+            tensoes, correntes = da_rede[nome]
+            resultado = vetorizados[nome]
+            cargas = np.asarray(rede.cargas(alimentador))
+            diferenca = np.max(np.abs(tensoes - resultado.tensoes)) / abs(resultado.tensoes[0])
+            print '%12s %6d %12.2e %12.2e %12.2e %11.3f kW %11.3f kW' % (
+                nome, len(rede.nomes), diferenca,
+                residuo(rede, cargas, tensoes), residuo(rede, cargas, resultado.tensoes),
+                perdas(rede, correntes) / 1e3, perdas(rede, resultado.correntes) / 1e3)
+
+        print '%12s rede: %.2f ms, vetorizado: %.3f ms, aceleracao: %.0fx' % (
+            nome_sub, 1e3 * tempo_rede, 1e3 * tempo_vetorizado,
+            tempo_rede / tempo_vetorizado)
+    print
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--setores', type=int, default=10,
+                        help='setores por alimentador da rede sintetica')
+    parser.add_argument('--nos', type=int, default=3, help='nos de carga por setor')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args()
+
+    comparar(os.path.basename(ARQUIVO_PADRAO), carregar(ARQUIVO_PADRAO), args.repeticoes)
+
+    descritor, arquivo = tempfile.mkstemp(suffix='.xml')
+    os.close(descritor)
+    try:
+        gerar_rede(arquivo, setores=args.setores, nos=args.nos, semente=args.semente)
+        topologia = carregar(arquivo)
+    finally:
+        # o documento do arquivo temporário não é mais usado
+        descartar_documentos(arquivo)
+        os.remove(arquivo)
+    comparar('rede sintetica (%d setores x %d nos por alimentador)' % (args.setores, args.nos),
+             topologia, args.repeticoes)
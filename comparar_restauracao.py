@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compara a restauração com busca binária (eliminar_violacoes_por_bisseccao)
+com a restauração sequencial (eliminar_violacoes) em redes sintéticas.
+
+Para cada semente é gerada uma rede (gerador_rede) e, para cada setor de
+cada alimentador, simula-se a falta no setor: o ramo a partir dele é
+podado do alimentador e inserido, por cada chave de fronteira, em cada
+alimentador vizinho, dentro de uma Transacao. As violações são então
+eliminadas pelos dois métodos, a partir do mesmo estado, e são comparados
+o resultado (se a restauração é possível), os setores que permanecem no
+alimentador e a chave de isolação. Entre os dois métodos a transação é
+desfeita, de modo que ambos partem do mesmo estado.
+
+Como em restaurar_ramos, o ramo só é considerado restaurado se a
+estrutura do alimentador foi modificada. Os casos em que a busca
+sequencial, que é a referência, falha (as árvores da biblioteca rede
+não permitem alguma das podas) são listados à parte e não contam como
+diferença.
+
+O script imprime, por semente, o número de casos, de diferenças e de
+casos sem referência e, para cada um destes, os dois resultados.
+Termina com código de saída 1 se houver alguma diferença.
+
+Uso:
+    python comparar_restauracao.py [--sementes N] [--setores N] [--nos N]
+                                   [--carregamento C]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import agente_alimentador
+from pade.acl.aid import AID
+
+from agente_alimentador import (eliminar_violacoes, eliminar_violacoes_por_bisseccao,
+                                identificar_setor_de_insercao)
+from gerador_rede import gerar_rede
+from topologia import ArmazemTopologia
+from xml2objects import descartar_documentos
+
+
+METODOS = (('sequencial', eliminar_violacoes),
+           ('bisseccao', eliminar_violacoes_por_bisseccao))
+
+
+class Agente(object):
+    # as funções de eliminação de violações só usam o nome do agente,
+    # nas mensagens exibidas
+    def __init__(self, nome):
+        self.aid = AID(name=nome)
+
+
+class Silencio(object):
+    # as mensagens impressas pelo carregamento e pela restauração não
+    # interessam aqui
+    def __enter__(self):
+        self.saida, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        self.display_message = agente_alimentador.display_message
+        agente_alimentador.display_message = lambda *args: None
+
+    def __exit__(self, *args):
+        agente_alimentador.display_message = self.display_message
+        sys.stdout.close()
+        sys.stdout = self.saida
+
+
+def carregar(semente, setores, nos, carregamento):
+    descritor, arquivo = tempfile.mkstemp(suffix='.xml')
+    os.close(descritor)
+    try:
+        gerar_rede(arquivo, subestacoes=1, alimentadores=2, setores=setores, nos=nos,
+                   densidade_na=0.5, carregamento=carregamento, semente=semente)
+        armazem = ArmazemTopologia(arquivo, leitor='iterparse', snapshot=False)
+        with Silencio():
+            armazem.topologia
+    finally:
+        # o documento do arquivo temporário não é mais usado
+        descartar_documentos(arquivo)
+        os.remove(arquivo)
+    return armazem
+
+
+def eliminar(agente, alimentador, subestacao, no, ramo, no_raiz, funcao):
+    # insere o ramo e elimina as violações com funcao; a transação é
+    # desfeita ao final e o resultado é retornado como tupla comparável
+    transacao = alimentador.iniciar_transacao()
+    try:
+        transacao.inserir_ramo(no, ramo, no_raiz)
+        possivel, chave_de_isolacao = funcao(agente, alimentador, subestacao,
+                                             transacao, no_raiz)
+        # como em restaurar_ramos, o ramo só é restaurado se a
+        # estrutura do alimentador foi modificada
+        if not (possivel and transacao.alterou()):
+            return (False, None, None)
+        return (True, sorted(alimentador.setores), chave_de_isolacao)
+    except Exception as erro:
+        return ('erro', '%s: %s' % (type(erro).__name__, erro))
+    finally:
+        alimentador.desfazer_transacao()
+
+
+def casos(armazem):
+    # (falta, ramo, alimentador de recomposição, subestação, inserção)
+    # para cada setor de cada alimentador e cada chave de fronteira do
+    # ramo a partir dele
+    topologia = armazem.topologia
+    for nome, alimentador in sorted(topologia['alimentadores'].items()):
+        for setor in sorted(alimentador.setores):
+            if setor == alimentador.rnp[1, 0]:
+                continue
+            visao = armazem.visao([nome])
+            try:
+                with Silencio():
+                    ramo = visao['alimentadores'][nome].podar(setor, alterar_rnp=True)
+            except Exception:
+                # a falta não pode ser isolada: não há o que comparar
+                continue
+            for outro in sorted(visao['alimentadores']):
+                if outro == nome:
+                    continue
+                vizinho = visao.alimentador_mutavel(outro)
+                subestacao = [sub for sub in visao['subestacoes'].values()
+                              if outro in sub.alimentadores][0]
+                for no, no_raiz, chave in identificar_setor_de_insercao(ramo, vizinho):
+                    yield setor, ramo, vizinho, subestacao, (no, no_raiz, chave)
+
+
+def comparar(semente, setores, nos, carregamento):
+    armazem = carregar(semente, setores, nos, carregamento)
+    agente = Agente('comparar_restauracao')
+    total, diferencas, sem_referencia = 0, list(), list()
+    for setor, ramo, alimentador, subestacao, (no, no_raiz, chave) in casos(armazem):
+        resultados = list()
+        with Silencio():
+            for _, funcao in METODOS:
+                resultados.append(eliminar(agente, alimentador, subestacao, no, ramo,
+                                           no_raiz, funcao))
+        total += 1
+        caso = (setor, alimentador.nome, chave, resultados)
+        if resultados[0][0] == 'erro':
+            # a busca sequencial, que é a referência, falhou
+            sem_referencia.append(caso)
+        elif resultados[0] != resultados[1]:
+            diferencas.append(caso)
+
+    print '%8d %6d %11d %15d' % (semente, total, len(diferencas), len(sem_referencia))
+    for titulo, lista in (('diferenca', diferencas), ('sem referencia', sem_referencia)):
+        for setor, alimentador, chave, resultados in lista:
+            print '    %s: falta em %s, recomposicao por %s (chave %s)' % (
+                titulo, setor, alimentador, chave)
+            for (metodo, _), resultado in zip(METODOS, resultados):
+                print '        %-10s %s' % (metodo, resultado)
+    return len(diferencas)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sementes', type=int, default=20,
+                        help='numero de redes sinteticas (sementes 0 a N - 1)')
+    parser.add_argument('--setores', type=int, default=12, help='setores por alimentador')
+    parser.add_argument('--nos', type=int, default=3, help='nos de carga por setor')
+    parser.add_argument('--carregamento', type=float, default=0.5,
+                        help='carregamento dos alimentadores (gerador_rede)')
+    args = parser.parse_args()
+
+    print '%8s %6s %11s %15s' % ('semente', 'casos', 'diferencas', 'sem referencia')
+    diferencas = sum(comparar(semente, args.setores, args.nos, args.carregamento)
+                     for semente in range(args.sementes))
+    sys.exit(1 if diferencas else 0)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Vetores de fasores para o fluxo de carga vetorizado.
+
+FasorArray guarda um vetor de fasores de um mesmo tipo (as constantes
+Tensao, Corrente, Impedancia e Potencia de rede.Fasor) em um ndarray
+complex128 (valores). As operações aceitam out=, de modo que laços
+repetidos (como as iterações do fluxo de carga em RedeRadial.resolver)
+não alocam vetores novos.
+
+FasorArray é usado apenas dentro do fluxo de carga: os nós de carga e
+trechos da topologia continuam com rede.Fasor, que é o tipo verificado
+pelos objetos de rede.
+"""
+
+import numpy as np
+
+
+class FasorArray(object):
+    """Vetor de fasores de um mesmo tipo sobre um ndarray complex128"""
+
+    __slots__ = ('valores', 'tipo')
+
+    def __init__(self, valores, tipo):
+        self.valores = np.asarray(valores, dtype=np.complex128)
+        self.tipo = tipo
+
+    @classmethod
+    def zeros(cls, n, tipo):
+        return cls(np.zeros(n, dtype=np.complex128), tipo)
+
+    @classmethod
+    def de_fasores(cls, fasores, tipo):
+        """FasorArray com os valores de uma sequência de rede.Fasor"""
+        fasores = list(fasores)
+        valores = np.empty(len(fasores), dtype=np.complex128)
+        valores.real = [fasor.real for fasor in fasores]
+        valores.imag = [fasor.imag for fasor in fasores]
+        return cls(valores, tipo)
+
+    def __len__(self):
+        return len(self.valores)
+
+    def _operacao(self, funcao, outro, out):
+        if isinstance(outro, FasorArray):
+            outro = outro.valores
+        if out is None:
+            return FasorArray(funcao(self.valores, outro), self.tipo)
+        funcao(self.valores, outro, out=out.valores)
+        return out
+
+    def subtrair(self, outro, out=None):
+        return self._operacao(np.subtract, outro, out)
+
+    def multiplicar(self, outro, out=None):
+        return self._operacao(np.multiply, outro, out)
+
+    def dividir(self, outro, out=None):
+        return self._operacao(np.divide, outro, out)
+
+    def __repr__(self):
+        return 'FasorArray(n=%d, tipo=%d)' % (len(self.valores), self.tipo)
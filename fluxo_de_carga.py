@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fluxo de carga por varredura (backward/forward sweep) com vetores NumPy.
+
+Cada alimentador é convertido uma única vez em uma RedeRadial: os nós de
+carga na ordem da RNP da árvore de nós de carga (arvore_nos_de_carga),
+o pai de cada nó, o fim da subárvore de cada nó e a impedância do trecho
+(ou dos trechos ligados por uma chave) entre cada nó e o seu pai. Como na
+RNP a subárvore de um nó ocupa posições contíguas, as duas varreduras
+são feitas com somas acumuladas, sem percorrer os nós em Python:
+
+    corrente no trecho do nó i = soma das correntes de carga em fim[i]
+    tensão no nó i = tensão na raiz - soma das quedas nos trechos do
+                     caminho da raiz até i
+
+As tensões são de linha, a partir da tensão secundária dos
+transformadores da subestação (tensao_da_subestacao), e as
+potências dos nós de carga são trifásicas, de modo que a corrente de
+carga é conj(S / (sqrt(3) V)) e a queda no trecho é sqrt(3) Z I.
+
+As grandezas calculadas só são escritas nos objetos (no.tensao e
+trecho.fluxo, como rede.Fasor) quando solicitado. A RedeRadial de cada
+alimentador fica em cache enquanto a RNP da árvore de nós de carga for a
+mesma; alterações nos condutores ou comprimentos dos trechos exigem
+descartar_rede_radial.
+
+No modo incremental, cada RedeRadial guarda o último resultado calculado.
+Alimentadores cuja topologia, cargas e tensão na raiz não mudaram desde
+o último cálculo não são recalculados, e os demais partem das tensões do
+último resultado (após uma poda ou inserção, as tensões dos nós que
+permaneceram no alimentador; os nós inseridos partem da tensão do
+ancestral mais próximo já conhecido), convergindo em poucas iterações.
+
+verificar_carregamento e verificar_tensao comparam os vetores de um
+resultado com as ampacidades dos trechos e com a faixa de tensão, sem
+ler os objetos, e retornam todas as violações (Violacao) com as suas
+margens. alivios estima, para uma violação, o quanto ela pode ser
+reduzida retirando a carga de cada nó, o que permite descartar de uma
+vez as podas que certamente não a eliminam.
+"""
+
+import weakref
+from collections import namedtuple
+
+import numpy as np
+from rede import Fasor
+
+from fasor import FasorArray
+
+RAIZ_DE_3 = np.sqrt(3.0)
+
+TOLERANCIA = 1e-6  # variação máxima de tensão entre iterações, em pu
+MAX_ITERACOES = 50
+
+# faixa de tensão admissível nos nós de carga, em pu da tensão da subestação
+LIMITES_DE_TENSAO = (0.95, 1.05)
+
+# violação de uma restrição: tipo ('potencia', 'carregamento', 'tensao'
+# ou 'conexao', quando falta um trecho na rede radial), alimentador e
+# elemento (trecho ou nó de carga) violados, posição do nó na RedeRadial,
+# valor da grandeza (VA, A ou V), limite e margem relativa ao limite,
+# negativa
+Violacao = namedtuple('Violacao', ['tipo', 'alimentador', 'elemento', 'posicao',
+                                   'valor', 'limite', 'margem'])
+
+
+class LigacaoInexistente(ValueError):
+    """Não há trecho entre dois nós adjacentes na árvore de nós de carga
+    do alimentador
+    """
+
+    def __init__(self, alimentador, n1, n2):
+        super(LigacaoInexistente, self).__init__(
+            'Nao ha trecho entre os nos %s e %s do alimentador %s' % (n1, n2, alimentador))
+        self.alimentador = alimentador
+        self.nos = (n1, n2)
+
+
+class ResultadoFluxo(object):
+    """Tensões nos nós de carga e correntes nos trechos (do pai para o
+    nó), na ordem de RedeRadial.nomes
+    """
+
+    __slots__ = ('tensoes', 'correntes', 'iteracoes', 'convergiu')
+
+    def __init__(self, tensoes, correntes, iteracoes, convergiu):
+        self.tensoes = tensoes
+        self.correntes = correntes
+        self.iteracoes = iteracoes
+        self.convergiu = convergiu
+
+    @property
+    def fasores_de_tensao(self):
+        return FasorArray(self.tensoes, Fasor.Tensao)
+
+    @property
+    def fasores_de_corrente(self):
+        return FasorArray(self.correntes, Fasor.Corrente)
+
+
+class RedeRadial(object):
+    """Vetores de um alimentador ordenados pela RNP da árvore de nós de carga"""
+
+    def __init__(self, alimentador):
+        self.rnp = alimentador.arvore_nos_de_carga.rnp
+        self.nomes = [str(nome) for nome in self.rnp[1, :]]
+        self.indice = dict((nome, i) for i, nome in enumerate(self.nomes))
+        n = len(self.nomes)
+
+        # pai de cada nó e fim (exclusive) da sua subárvore na RNP
+        profundidades = self.rnp[0, :].astype(np.int32)
+        self.pai = np.full(n, -1, dtype=np.int32)
+        self.fim = np.full(n, n, dtype=np.int32)
+        pilha = []
+        for i in range(n):
+            while pilha and profundidades[pilha[-1]] >= profundidades[i]:
+                self.fim[pilha.pop()] = i
+            if pilha:
+                self.pai[i] = pilha[-1]
+            pilha.append(i)
+        self.posicoes = np.arange(n, dtype=np.int32)
+
+        # impedância e trechos entre cada nó e o seu pai
+        ligacoes = _ligacoes(alimentador)
+        self.impedancia = np.zeros(n, dtype=np.complex128)
+        self.trechos = [()] * n
+        for i in range(1, n):
+            par = frozenset((self.nomes[self.pai[i]], self.nomes[i]))
+            if par not in ligacoes:
+                raise LigacaoInexistente(alimentador.nome, self.nomes[self.pai[i]],
+                                         self.nomes[i])
+            self.impedancia[i], self.trechos[i] = ligacoes[par]
+
+        # menor ampacidade entre os trechos de cada ligação e o trecho
+        # correspondente; a raiz não tem trecho
+        self.ampacidades = np.full(n, np.inf)
+        self.trechos_limitantes = [None] * n
+        for i in range(1, n):
+            ampacidade, nome = min((float(alimentador.trechos[nome].condutor.ampacidade), nome)
+                                   for nome in self.trechos[i])
+            self.ampacidades[i], self.trechos_limitantes[i] = ampacidade, nome
+
+        # a queda no trecho de cada nó deixa a soma acumulada das quedas
+        # na posição fim do nó: os nós são agrupados por essa posição
+        ordem = np.argsort(self.fim, kind='mergesort')
+        fins = self.fim[ordem]
+        self.ordem_de_saida = ordem
+        self.inicios_de_saida = np.flatnonzero(np.concatenate(([True], fins[1:] != fins[:-1])))
+        self.saidas = fins[self.inicios_de_saida]
+
+        # impedâncias multiplicadas por sqrt(3), para a queda de tensão de linha
+        self.impedancia_de_linha = FasorArray(RAIZ_DE_3 * self.impedancia, Fasor.Impedancia)
+
+        # vetores de trabalho, reutilizados em todas as iterações
+        self._acumulada = np.zeros(n + 1, dtype=np.complex128)
+        self._marcas = np.zeros(n + 1, dtype=np.complex128)
+        self._quedas_por_saida = np.zeros(n, dtype=np.complex128)
+        self._soma_por_saida = np.zeros(len(self.saidas), dtype=np.complex128)
+        self._correntes_de_carga = FasorArray.zeros(n, Fasor.Corrente)
+        self._quedas = FasorArray.zeros(n, Fasor.Tensao)
+        self._diferenca = FasorArray.zeros(n, Fasor.Tensao)
+        self._modulos = np.zeros(n)
+
+        # último cálculo, para o modo incremental
+        self.resultado = None
+        self.potencias = None
+        self.tensao_raiz = None
+        self.escrito = False
+
+    def cargas(self, alimentador):
+        """Potências dos nós de carga, em VA"""
+        nos = alimentador.nos_de_carga
+        return FasorArray.de_fasores((nos[nome].potencia for nome in self.nomes),
+                                     Fasor.Potencia).valores
+
+    def correntes_nos_trechos(self, correntes_de_carga, out=None):
+        # soma das correntes de carga de cada subárvore
+        n = len(self.nomes)
+        if out is None:
+            out = np.empty(n, dtype=np.complex128)
+        acumulada = self._acumulada
+        np.cumsum(correntes_de_carga, out=acumulada[1:])
+        np.take(acumulada, self.fim, out=out, mode='clip')
+        return np.subtract(out, acumulada[:n], out=out)
+
+    def quedas_acumuladas(self, quedas, out=None):
+        # soma das quedas de cada nó e dos seus ancestrais: a queda do nó
+        # i entra na soma acumulada na posição i e sai na posição fim[i]
+        n = len(self.nomes)
+        if out is None:
+            out = np.empty(n, dtype=np.complex128)
+        marcas, por_saida = self._marcas, self._soma_por_saida
+        np.take(quedas, self.ordem_de_saida, out=self._quedas_por_saida, mode='clip')
+        np.add.reduceat(self._quedas_por_saida, self.inicios_de_saida, out=por_saida)
+        np.negative(por_saida, out=por_saida)
+        marcas.fill(0.0)
+        np.put(marcas, self.saidas, por_saida)
+        np.add(marcas[:n], quedas, out=marcas[:n])
+        return np.cumsum(marcas[:n], out=out)
+
+    def resolver(self, cargas, tensao_raiz, tensoes=None,
+                 tolerancia=TOLERANCIA, max_iteracoes=MAX_ITERACOES):
+        """Calcula o fluxo de carga para as potências em cargas e a tensão
+        na raiz, partindo das tensões informadas ou da tensão da raiz
+        em todos os nós.
+
+        As iterações alternam entre dois vetores de tensões e escrevem
+        as demais grandezas nos vetores de trabalho da RedeRadial, sem
+        alocar vetores novos.
+        """
+        n = len(self.nomes)
+        if tensoes is None:
+            tensoes = np.full(n, tensao_raiz, dtype=np.complex128)
+        tensoes = FasorArray(np.array(tensoes, dtype=np.complex128), Fasor.Tensao)
+        novas = FasorArray.zeros(n, Fasor.Tensao)
+        correntes = FasorArray.zeros(n, Fasor.Corrente)
+        limite = tolerancia * abs(tensao_raiz)
+
+        # corrente de carga = conj(S / (sqrt(3) V))
+        cargas = FasorArray(np.divide(cargas, RAIZ_DE_3), Fasor.Potencia)
+        correntes_de_carga, quedas = self._correntes_de_carga, self._quedas
+        diferenca, modulos = self._diferenca, self._modulos
+
+        convergiu = False
+        for iteracao in range(1, max_iteracoes + 1):
+            cargas.dividir(tensoes, out=correntes_de_carga)
+            np.conjugate(correntes_de_carga.valores, out=correntes_de_carga.valores)
+            self.correntes_nos_trechos(correntes_de_carga.valores, out=correntes.valores)
+
+            correntes.multiplicar(self.impedancia_de_linha, out=quedas)
+            self.quedas_acumuladas(quedas.valores, out=novas.valores)
+            np.subtract(tensao_raiz, novas.valores, out=novas.valores)
+
+            novas.subtrair(tensoes, out=diferenca)
+            variacao = np.absolute(diferenca.valores, out=modulos).max()
+            tensoes, novas = novas, tensoes
+            if variacao < limite:
+                convergiu = True
+                break
+
+        return ResultadoFluxo(tensoes.valores, correntes.valores, iteracao, convergiu)
+
+    def atualizada(self, cargas, tensao_raiz):
+        """Indica se o último resultado corresponde às cargas e à tensão
+        na raiz informadas
+        """
+        return (self.resultado is not None and
+                self.tensao_raiz == tensao_raiz and
+                np.array_equal(self.potencias, cargas))
+
+    def tensoes_iniciais(self, anterior):
+        """Tensões iniciais a partir do último resultado da RedeRadial
+        anterior do mesmo alimentador: os nós que já estavam na rede
+        anterior partem da tensão calculada e os demais da tensão do pai
+        """
+        if anterior is self:
+            return self.resultado.tensoes.copy()
+        posicoes = np.array([anterior.indice.get(nome, -1) for nome in self.nomes],
+                            dtype=np.int32)
+        tensoes = anterior.resultado.tensoes[posicoes]
+        # os pais vêm antes dos filhos na RNP
+        for i in np.flatnonzero(posicoes < 0):
+            tensoes[i] = tensoes[self.pai[i]] if i > 0 else anterior.tensao_raiz
+        return tensoes
+
+    def escrever(self, alimentador, resultado):
+        """Escreve as tensões nos nós de carga e as correntes nos trechos,
+        como rede.Fasor
+        """
+        nos, trechos = alimentador.nos_de_carga, alimentador.trechos
+        for nome, tensao in zip(self.nomes, resultado.tensoes):
+            nos[nome].tensao = Fasor(real=float(tensao.real), imag=float(tensao.imag),
+                                     tipo=Fasor.Tensao)
+        for nomes_trechos, corrente in zip(self.trechos, resultado.correntes):
+            for nome in nomes_trechos:
+                trechos[nome].fluxo = Fasor(real=float(corrente.real),
+                                            imag=float(corrente.imag), tipo=Fasor.Corrente)
+
+
+def _impedancia(trecho):
+    # a mesma de rede.Trecho.calcula_impedancia: comprimento do trecho
+    # vezes a resistência e a reatância do condutor
+    return trecho.comprimento * complex(float(trecho.condutor.rp),
+                                        float(trecho.condutor.xp))
+
+
+def _ligacoes(alimentador):
+    # par de nós -> (impedância, nomes dos trechos) para os trechos entre
+    # dois nós e para os pares de trechos ligados por uma chave. As
+    # chaves são identificadas pelo nome: um ramo vindo de outro
+    # alimentador pode trazer outro objeto para a mesma chave
+    chaves, nos = alimentador.chaves, alimentador.nos_de_carga
+    ligacoes = dict()
+    por_chave = dict()
+    for trecho in alimentador.trechos.values():
+        n1, n2 = trecho.n1.nome, trecho.n2.nome
+        if n1 in chaves and trecho.n1 is not nos.get(n1):
+            por_chave.setdefault(n1, []).append((n2, trecho))
+        elif n2 in chaves and trecho.n2 is not nos.get(n2):
+            por_chave.setdefault(n2, []).append((n1, trecho))
+        else:
+            ligacoes[frozenset((n1, n2))] = (_impedancia(trecho), (trecho.nome,))
+
+    for lados in por_chave.values():
+        if len(lados) == 2:
+            (no_1, trecho_1), (no_2, trecho_2) = lados
+            ligacoes[frozenset((no_1, no_2))] = (_impedancia(trecho_1) + _impedancia(trecho_2),
+                                                 (trecho_1.nome, trecho_2.nome))
+    return ligacoes
+
+
+def tensao_da_subestacao(subestacao):
+    """Tensão de linha na barra da subestação (complexa, em V): a tensão
+    secundária dos seus transformadores. Não depende de subestacao.tensao,
+    que só existe após Subestacao.calcular_fluxo_de_carga
+    """
+    transformador = subestacao.transformadores[min(subestacao.transformadores)]
+    tensao = transformador.tensao_secundario
+    return complex(tensao.real, tensao.imag)
+
+
+_redes = weakref.WeakKeyDictionary()
+
+
+def rede_radial(alimentador):
+    """RedeRadial do alimentador, reconstruída apenas quando a RNP da
+    árvore de nós de carga muda
+    """
+    rede = _redes.get(alimentador)
+    if rede is None or rede.rnp is not alimentador.arvore_nos_de_carga.rnp:
+        rede = _redes[alimentador] = RedeRadial(alimentador)
+    return rede
+
+
+def descartar_rede_radial(alimentador):
+    _redes.pop(alimentador, None)
+
+
+def calcular_fluxo_de_carga(subestacao, escrever=True, incremental=True,
+                            tolerancia=TOLERANCIA, max_iteracoes=MAX_ITERACOES):
+    """Calcula o fluxo de carga de todos os alimentadores da subestação.
+
+    Retorna um dicionário alimentador -> ResultadoFluxo. Com escrever, as
+    tensões e correntes também são escritas em no.tensao e trecho.fluxo,
+    como em Subestacao.calcular_fluxo_de_carga. Com incremental, apenas
+    os alimentadores alterados desde o último cálculo são recalculados,
+    partindo das tensões anteriores; sem incremental, todos partem da
+    tensão da raiz.
+    """
+    tensao_raiz = tensao_da_subestacao(subestacao)
+    resultados = dict()
+    for nome, alimentador in subestacao.alimentadores.items():
+        anterior = _redes.get(alimentador)
+        rede = rede_radial(alimentador)
+        cargas = rede.cargas(alimentador)
+
+        if incremental and rede.atualizada(cargas, tensao_raiz):
+            resultado = rede.resultado
+        else:
+            tensoes = None
+            if incremental and anterior is not None and anterior.resultado is not None:
+                tensoes = rede.tensoes_iniciais(anterior)
+            resultado = rede.resolver(cargas, tensao_raiz, tensoes,
+                                      tolerancia=tolerancia,
+                                      max_iteracoes=max_iteracoes)
+            rede.resultado, rede.potencias, rede.tensao_raiz = resultado, cargas, tensao_raiz
+            rede.escrito = False
+
+        if escrever and not rede.escrito:
+            rede.escrever(alimentador, resultado)
+            rede.escrito = True
+        resultados[nome] = resultado
+    return resultados
+
+
+def verificar_carregamento(subestacao, resultados):
+    """Violações de ampacidade nos trechos dos alimentadores, da menor
+    para a maior margem
+    """
+    violacoes = list()
+    for nome, resultado in resultados.items():
+        rede = rede_radial(subestacao.alimentadores[nome])
+        correntes = np.abs(resultado.correntes)
+        margens = 1.0 - correntes / rede.ampacidades
+        for i in np.flatnonzero(margens < 0.0):
+            violacoes.append(Violacao('carregamento', nome, rede.trechos_limitantes[i], int(i),
+                                      correntes[i], rede.ampacidades[i], margens[i]))
+    violacoes.sort(key=lambda violacao: violacao.margem)
+    return violacoes
+
+
+def verificar_tensao(subestacao, resultados, limites=LIMITES_DE_TENSAO):
+    """Violações da faixa de tensão nos nós de carga dos alimentadores,
+    da menor para a maior margem
+    """
+    referencia = abs(tensao_da_subestacao(subestacao))
+    minimo, maximo = limites[0] * referencia, limites[1] * referencia
+    violacoes = list()
+    for nome, resultado in resultados.items():
+        rede = rede_radial(subestacao.alimentadores[nome])
+        modulos = np.abs(resultado.tensoes)
+        for i in np.flatnonzero((modulos < minimo) | (modulos > maximo)):
+            limite = minimo if modulos[i] < minimo else maximo
+            violacoes.append(Violacao('tensao', nome, rede.nomes[i], int(i), modulos[i],
+                                      limite, -abs(modulos[i] - limite) / limite))
+    violacoes.sort(key=lambda violacao: violacao.margem)
+    return violacoes
+
+
+def alivios(rede, resultado, cargas, violacao, posicoes):
+    """Redução necessária da violação e, para cada nó em posicoes, um
+    limite superior da redução obtida retirando a sua carga.
+
+    Para a potência dos trafos, o alívio de cada nó é o módulo da sua
+    carga; para o carregamento de um trecho, o módulo da sua corrente
+    de carga, se estiver a jusante do trecho; para a subtensão em um
+    nó, o módulo da sua corrente de carga vezes a soma dos módulos das
+    quedas por unidade de corrente (sqrt(3) |Z|) nos trechos comuns aos
+    caminhos da raiz até os dois nós. A sobretensão não é reduzida pela
+    retirada de cargas.
+
+    Como as cargas são de potência constante, a retirada de cargas
+    também reduz as correntes das que permanecem, cujas tensões sobem.
+    Essa redução, limitada pela de todas as cargas subindo até a tensão
+    da raiz, é descontada da redução necessária.
+    """
+    posicoes = np.asarray(posicoes, dtype=np.int32)
+    if violacao.tipo == 'potencia':
+        return violacao.valor - violacao.limite, np.abs(cargas[posicoes])
+
+    tensoes = np.abs(resultado.tensoes)
+    correntes = np.abs(cargas) / (RAIZ_DE_3 * tensoes)
+    folgas = correntes * np.maximum(1.0 - tensoes / tensoes[0], 0.0)
+    j = violacao.posicao
+    if violacao.tipo == 'carregamento':
+        necessario = violacao.valor - violacao.limite - folgas[j:rede.fim[j]].sum()
+        a_jusante = (posicoes >= j) & (posicoes < rede.fim[j])
+        return necessario, correntes[posicoes] * a_jusante
+
+    if violacao.valor > violacao.limite:
+        return violacao.valor - violacao.limite, np.zeros(len(posicoes))
+
+    # ancestrais de j (inclusive), em ordem, e soma das quedas por unidade
+    # de corrente nos trechos comuns aos caminhos até j e até cada nó
+    caminho = np.flatnonzero(rede.fim[:j + 1] > j)
+    quedas = RAIZ_DE_3 * np.cumsum(np.abs(rede.impedancia[caminho]))
+
+    def quedas_comuns(nos):
+        comuns = ((caminho <= nos[:, None]) & (nos[:, None] < rede.fim[caminho])).sum(axis=1)
+        return quedas[comuns - 1]
+
+    necessario = violacao.limite - violacao.valor - np.dot(quedas_comuns(rede.posicoes), folgas)
+    return necessario, quedas_comuns(posicoes) * correntes[posicoes]
@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+
+"""
+Gerador de redes sintéticas no formato xml lido por xml2objects.
+
+A rede gerada segue a mesma estrutura de rede_2.xml, com as seções
+<elementos>, <topologia> e <comunicacao>:
+
+    - cada subestação Sk possui um setor raiz Sk, com um único nó de
+      carga Sk, e um conjunto de transformadores Sk_Ti;
+    - cada alimentador Sk_ALj parte do setor raiz da sua subestação e é
+      formado por uma árvore aleatória de setores, ligados entre si por
+      chaves fechadas;
+    - os nós de carga de cada setor são ligados em série por trechos;
+    - chaves abertas de interconexão (NA) ligam setores de alimentadores
+      diferentes, na quantidade definida pela densidade de chaves NA.
+
+Sem uma carga média informada, as cargas dos nós são sorteadas em valores
+relativos e escaladas em cada alimentador de modo que, em operação
+normal, a maior corrente nos trechos e a maior queda de tensão usem
+apenas a fração carregamento da ampacidade do condutor e da queda
+admissível (QUEDA_ADMISSIVEL). A rede gerada começa sem violações de
+carregamento ou de tensão, com folga para receber ramos de alimentadores
+vizinhos na restauração. Com carga_media informada, as cargas são usadas
+como sorteadas e redes grandes tendem a violar os limites.
+
+Os elementos da topologia são escritos na ordem nós, setores, chaves,
+trechos, alimentadores e subestações, de forma que cada elemento só
+referencia elementos anteriores a ele, o que permite a leitura em fluxo.
+
+Com a opção --fragmentar, o arquivo informado é um diretório onde é
+gravado um fragmento xml por subestação, no formato aceito pela leitura
+paralela de carregar_topologia. As chaves de interconexão entre
+subestações são declaradas nos fragmentos das duas subestações.
+
+Uso:
+    python gerador_rede.py rede.xml --subestacoes 10 --alimentadores 4 \\
+        --setores 50 --nos 5 --densidade-na 0.1 --semente 1
+"""
+
+import argparse
+import math
+import os
+import random
+
+CONDUTORES = [('CAA 266R', '0.2391', '0.37895', '0.41693', '1.55591', '301'),
+              ('Cobre 70R', '0.3167', '0.41669', '0.49454', '1.94094', '274')]
+
+DISTRIBUICOES = ('uniforme', 'normal', 'constante')
+
+# tensão de linha no secundário dos transformadores, em V
+TENSAO_SECUNDARIA = 13.8e3
+
+# queda de tensão admissível até os nós de carga, em pu, a mesma da faixa
+# de tensão verificada em fluxo_de_carga
+QUEDA_ADMISSIVEL = 0.05
+
+
+class _Rede(object):
+    # estrutura intermediária com os dados da rede gerada
+
+    def __init__(self):
+        self.chaves = []          # (nome, estado, setor_1, setor_2)
+        self.nos = []             # nomes, na ordem de criação
+        self.dados_nos = dict()   # nome: [vizinhos, chaves, p, q]
+        self.setores = []         # nomes, na ordem de criação
+        self.dados_setores = dict()   # nome: [vizinhos, nos, prioridade]
+        self.trechos = []         # (nome, (tipo, n1), (tipo, n2), comprimento, condutor)
+        self.alimentadores = []   # (nome, setores, trechos, chaves, raiz)
+        self.transformadores = []     # (nome, potencia)
+        self.subestacoes = []     # (nome, alimentadores, transformadores)
+        self.dono = dict()        # (tipo, nome): subestações do elemento
+        self.subestacao = None    # subestação em geração
+
+    def novo_no(self, nome, p, q):
+        self.nos.append(nome)
+        self.dados_nos[nome] = [[], [], p, q]
+        self.dono[('no', nome)] = set([self.subestacao])
+
+    def novo_setor(self, nome, prioridade):
+        self.setores.append(nome)
+        self.dados_setores[nome] = [[], [], prioridade]
+        self.dono[('setor', nome)] = set([self.subestacao])
+
+    def nova_chave(self, estado, setor_1, setor_2):
+        nome = str(len(self.chaves) + 1)
+        self.chaves.append((nome, estado, setor_1, setor_2))
+        self.dono[('chave', nome)] = self.dono[('setor', setor_1)] | self.dono[('setor', setor_2)]
+        self.dados_setores[setor_1][0].append(setor_2)
+        self.dados_setores[setor_2][0].append(setor_1)
+        return nome
+
+    def ligar_nos(self, no_1, no_2):
+        self.dados_nos[no_1][0].append(no_2)
+        self.dados_nos[no_2][0].append(no_1)
+
+    def novo_trecho(self, n1, n2, comprimento, condutor):
+        nome = '%s_%s' % (n1[1], n2[1])
+        self.trechos.append((nome, n1, n2, comprimento, condutor))
+        # o trecho pertence à subestação do nó de carga ao qual está ligado
+        self.dono[('trecho', nome)] = self.dono[n1 if n1[0] == 'no' else n2]
+        return nome
+
+    def pertence(self, tipo, nome, subestacao):
+        return subestacao is None or subestacao in self.dono[(tipo, nome)]
+
+
+def _sortear_carga(aleatorio, distribuicao, media, desvio):
+    if distribuicao == 'constante':
+        return media
+    elif distribuicao == 'uniforme':
+        return aleatorio.uniform(max(0.0, media - desvio), media + desvio)
+    elif distribuicao == 'normal':
+        return max(0.0, aleatorio.gauss(media, desvio))
+    raise ValueError('Distribuicao de carga desconhecida: %s' % distribuicao)
+
+
+def gerar_rede(arquivo,
+               subestacoes=2,
+               transformadores=1,
+               alimentadores=2,
+               setores=5,
+               nos=3,
+               densidade_na=0.2,
+               distribuicao='uniforme',
+               carga_media=None,
+               carga_desvio=None,
+               fator_de_potencia=0.95,
+               folga_trafos=1.5,
+               carregamento=0.5,
+               semente=None,
+               fragmentar=False):
+    """Gera uma rede sintética e a grava no arquivo xml.
+
+    subestacoes: número de subestações
+    transformadores: número de transformadores por subestação
+    alimentadores: número de alimentadores por subestação
+    setores: número de setores por alimentador, sem contar o setor raiz
+    nos: número de nós de carga por setor
+    densidade_na: número de chaves NA de interconexão por setor
+    distribuicao: distribuição das cargas ativas dos nós
+        ('uniforme', 'normal' ou 'constante'), em W
+    carga_media, carga_desvio: parâmetros da distribuição de cargas.
+        Se carga_media for None, as cargas são escaladas em cada
+        alimentador de acordo com carregamento; carga_desvio, se None, é
+        40% da carga média
+    fator_de_potencia: fator de potência das cargas
+    folga_trafos: razão entre a potência dos transformadores e a
+        carga total da subestação
+    carregamento: fração da ampacidade do condutor e da queda de tensão
+        admissível usada por cada alimentador, quando carga_media é None
+    semente: semente do gerador de números aleatórios
+    fragmentar: se verdadeiro, arquivo é um diretório onde é gravado
+        um fragmento xml por subestação
+
+    Retorna um dicionário com a quantidade de elementos gerados.
+    """
+    if distribuicao not in DISTRIBUICOES:
+        raise ValueError('Distribuicao de carga desconhecida: %s' % distribuicao)
+
+    aleatorio = random.Random(semente)
+    tan_phi = math.tan(math.acos(fator_de_potencia))
+
+    # sem carga média, as cargas são sorteadas em valores relativos
+    escalar = carga_media is None
+    if escalar:
+        carga_media = 1.0
+    if carga_desvio is None:
+        carga_desvio = 0.4 * carga_media
+    rede = _Rede()
+    setores_por_alimentador = dict()
+
+    for k in range(1, subestacoes + 1):
+        nome_sub = 'S%d' % k
+        rede.subestacao = nome_sub
+        rede.novo_no(nome_sub, 0.0, 0.0)
+        rede.novo_setor(nome_sub, 0)
+        rede.dados_setores[nome_sub][1].append(nome_sub)
+        nomes_alimentadores = []
+        carga_sub = 0.0
+
+        for j in range(1, alimentadores + 1):
+            nome_al = '%s_AL%d' % (nome_sub, j)
+            nomes_alimentadores.append(nome_al)
+            rede.dono[('alimentador', nome_al)] = set([nome_sub])
+            setores_al, trechos_al, chaves_al = [nome_sub], [], []
+            condutor = CONDUTORES[(j - 1) % len(CONDUTORES)][0]
+            # (nó, nó pai, comprimento em km) de cada nó do alimentador,
+            # com o pai antes do filho
+            ligacoes_al = []
+
+            for i in range(1, setores + 1):
+                nome_setor = '%s_%d' % (nome_al, i)
+                rede.novo_setor(nome_setor, aleatorio.randint(0, 3))
+
+                # nós de carga do setor, ligados em série
+                nos_setor = rede.dados_setores[nome_setor][1]
+                ligacoes_setor = []
+                for n in range(1, nos + 1):
+                    nome_no = '%s_%d' % (nome_setor, n)
+                    p = _sortear_carga(aleatorio, distribuicao, carga_media, carga_desvio)
+                    rede.novo_no(nome_no, p, p * tan_phi)
+                    if nos_setor:
+                        comprimento = aleatorio.uniform(0.5, 1.5)
+                        rede.ligar_nos(nos_setor[-1], nome_no)
+                        trechos_al.append(rede.novo_trecho(('no', nos_setor[-1]), ('no', nome_no),
+                                                           comprimento, condutor))
+                        ligacoes_setor.append((nome_no, nos_setor[-1], comprimento))
+                    nos_setor.append(nome_no)
+
+                # o setor é ligado por uma chave fechada a um setor já
+                # existente do alimentador, formando uma árvore aleatória
+                pai = aleatorio.choice(setores_al)
+                no_pai = aleatorio.choice(rede.dados_setores[pai][1])
+                chave = rede.nova_chave('fechado', pai, nome_setor)
+                comprimento = _ligar_por_chave(rede, aleatorio, chave, no_pai, nos_setor[0],
+                                               condutor, trechos_al, trechos_al)
+                ligacoes_al.append((nos_setor[0], no_pai, comprimento))
+                ligacoes_al.extend(ligacoes_setor)
+                chaves_al.append(chave)
+                setores_al.append(nome_setor)
+
+            if escalar:
+                fator = _fator_de_carga(rede, ligacoes_al, condutor, carregamento)
+                for no, _, _ in ligacoes_al:
+                    rede.dados_nos[no][2] *= fator
+                    rede.dados_nos[no][3] *= fator
+            carga_sub += sum(rede.dados_nos[no][2] for no, _, _ in ligacoes_al)
+
+            setores_por_alimentador[nome_al] = (setores_al, trechos_al, chaves_al)
+
+        nomes_trafos = []
+        for t in range(1, transformadores + 1):
+            nome_trafo = '%s_T%d' % (nome_sub, t)
+            nomes_trafos.append(nome_trafo)
+            rede.dono[('transformador', nome_trafo)] = set([nome_sub])
+            rede.transformadores.append((nome_trafo, folga_trafos * carga_sub / fator_de_potencia / transformadores))
+        rede.subestacoes.append((nome_sub, nomes_alimentadores, nomes_trafos))
+        rede.dono[('subestacao', nome_sub)] = set([nome_sub])
+
+    # chaves NA de interconexão entre setores de alimentadores diferentes
+    nomes_alimentadores = sorted(setores_por_alimentador.keys())
+    n_na = int(round(densidade_na * len(nomes_alimentadores) * setores))
+    if len(nomes_alimentadores) < 2 or setores < 1:
+        n_na = 0
+    for _ in range(n_na):
+        al_1, al_2 = aleatorio.sample(nomes_alimentadores, 2)
+        setores_1, trechos_1, chaves_1 = setores_por_alimentador[al_1]
+        setores_2, trechos_2, chaves_2 = setores_por_alimentador[al_2]
+        setor_1 = aleatorio.choice(setores_1[1:])
+        setor_2 = aleatorio.choice(setores_2[1:])
+        if setor_2 in rede.dados_setores[setor_1][0]:
+            continue
+        no_1 = aleatorio.choice(rede.dados_setores[setor_1][1])
+        no_2 = aleatorio.choice(rede.dados_setores[setor_2][1])
+        chave = rede.nova_chave('aberto', setor_1, setor_2)
+        _ligar_por_chave(rede, aleatorio, chave, no_1, no_2, CONDUTORES[0][0], trechos_1, trechos_2)
+        chaves_1.append(chave)
+        chaves_2.append(chave)
+
+    for nome_al in nomes_alimentadores:
+        setores_al, trechos_al, chaves_al = setores_por_alimentador[nome_al]
+        rede.alimentadores.append((nome_al, setores_al, trechos_al, chaves_al, setores_al[0]))
+
+    if fragmentar:
+        if not os.path.isdir(arquivo):
+            os.makedirs(arquivo)
+        for nome_sub, _, _ in rede.subestacoes:
+            _escrever_xml(os.path.join(arquivo, '%s.xml' % nome_sub), rede, nome_sub)
+    else:
+        _escrever_xml(arquivo, rede)
+
+    return {'subestacoes': len(rede.subestacoes),
+            'transformadores': len(rede.transformadores),
+            'alimentadores': len(rede.alimentadores),
+            'setores': len(rede.setores),
+            'nos': len(rede.nos),
+            'chaves': len(rede.chaves),
+            'trechos': len(rede.trechos)}
+
+
+def _ligar_por_chave(rede, aleatorio, chave, no_1, no_2, condutor, trechos_1, trechos_2):
+    # liga no_1 e no_2 através da chave, com um trecho de cada lado;
+    # cada trecho pertence ao alimentador do nó ao qual está ligado.
+    # Retorna o comprimento total da ligação, em km
+    rede.ligar_nos(no_1, no_2)
+    rede.dados_nos[no_1][1].append(chave)
+    rede.dados_nos[no_2][1].append(chave)
+    comprimento_1 = aleatorio.uniform(0.01, 0.5)
+    comprimento_2 = aleatorio.uniform(0.01, 0.5)
+    trechos_1.append(rede.novo_trecho(('no', no_1), ('chave', chave), comprimento_1, condutor))
+    trechos_2.append(rede.novo_trecho(('chave', chave), ('no', no_2), comprimento_2, condutor))
+    return comprimento_1 + comprimento_2
+
+
+def _fator_de_carga(rede, ligacoes, condutor, carregamento):
+    # fator pelo qual as cargas dos nós das ligações podem ser
+    # multiplicadas para que a maior corrente nos trechos e a maior queda
+    # de tensão fiquem na fração carregamento da ampacidade do condutor e
+    # da queda admissível. A queda é estimada por (R P + X Q) / V, sem as
+    # perdas, que a folga de carregamento absorve. As impedâncias são as
+    # dos fluxos de carga (rede.Trecho.calcula_impedancia): comprimento
+    # lido do xml, em metros, vezes rp e xp
+    _, rp, xp, _, _, ampacidade = [c for c in CONDUTORES if c[0] == condutor][0]
+    dados = rede.dados_nos
+
+    # potência a jusante de cada nó: o pai vem antes do filho
+    potencias = dict((no, complex(dados[no][2], dados[no][3])) for no, _, _ in ligacoes)
+    for no, pai, _ in reversed(ligacoes):
+        if pai in potencias:
+            potencias[pai] += potencias[no]
+
+    quedas = dict()
+    maior_corrente = maior_queda = 0.0
+    for no, pai, comprimento in ligacoes:
+        potencia = potencias[no]
+        quedas[no] = quedas.get(pai, 0.0) + comprimento * 1e3 * (
+            float(rp) * potencia.real + float(xp) * potencia.imag) / TENSAO_SECUNDARIA
+        maior_queda = max(maior_queda, quedas[no])
+        maior_corrente = max(maior_corrente, abs(potencia) / (math.sqrt(3) * TENSAO_SECUNDARIA))
+
+    if maior_corrente == 0.0:
+        return 1.0
+    return carregamento * min(float(ampacidade) / maior_corrente,
+                              QUEDA_ADMISSIVEL * TENSAO_SECUNDARIA / maior_queda)
+
+
+def _filhos(tipo, nomes):
+    return ''.join('<%s nome="%s"/>' % (tipo, nome) for nome in nomes)
+
+
+def _escrever_xml(arquivo, rede, subestacao=None):
+    # grava a rede completa ou, se subestacao for informada,
+    # apenas os elementos que pertencem a ela
+    pertence = rede.pertence
+
+    with open(arquivo, 'w') as f:
+        escrever = f.write
+        escrever('<?xml version="1.0" encoding="UTF-8"?>\n<rede>\n\t<elementos>\n')
+
+        for nome, estado, _, _ in rede.chaves:
+            if not pertence('chave', nome, subestacao):
+                continue
+            escrever('\t\t<chave nome="%s" estado="%s"/>\n' % (nome, estado))
+        for nome in rede.nos:
+            if not pertence('no', nome, subestacao):
+                continue
+            p, q = rede.dados_nos[nome][2:]
+            escrever('\t\t<no nome="%s">'
+                     '<potencia tipo="ativa" multip="k" unid="W">%.3f</potencia>'
+                     '<potencia tipo="reativa" multip="k" unid="VAr">%.3f</potencia>'
+                     '</no>\n' % (nome, p / 1e3, q / 1e3))
+        for nome in rede.setores:
+            if not pertence('setor', nome, subestacao):
+                continue
+            escrever('\t\t<setor nome="%s" prioridade="%d"/>\n' % (nome, rede.dados_setores[nome][2]))
+        for condutor in CONDUTORES:
+            escrever('\t\t<condutor nome="%s" rp="%s" xp="%s" rz="%s" xz="%s" ampacidade="%s"/>\n' % condutor)
+        for nome, _, _, comprimento, _ in rede.trechos:
+            if not pertence('trecho', nome, subestacao):
+                continue
+            escrever('\t\t<trecho nome="%s"><comprimento multip="k" unid="m">%.3f</comprimento></trecho>\n'
+                     % (nome, comprimento))
+        for nome, _, _, _, _ in rede.alimentadores:
+            if not pertence('alimentador', nome, subestacao):
+                continue
+            escrever('\t\t<alimentador nome="%s"/>\n' % nome)
+        for nome, potencia in rede.transformadores:
+            if not pertence('transformador', nome, subestacao):
+                continue
+            escrever('\t\t<transformador nome="%s">'
+                     '<potencia tipo="aparente" multip="M" unid="VA">%.3f</potencia>'
+                     '<impedancia tipo="seq_pos"><resistencia multip="" unid="ohms">10.0</resistencia>'
+                     '<reatancia multip="" unid="ohms">3.0</reatancia></impedancia>'
+                     '<impedancia tipo="seq_zero"><resistencia multip="" unid="ohms">10.0</resistencia>'
+                     '<reatancia multip="" unid="ohms">3.0</reatancia></impedancia>'
+                     '<enrolamento tipo="primario"><tensao multip="k" unid="V">69</tensao></enrolamento>'
+                     '<enrolamento tipo="secundario"><tensao multip="k" unid="V">13.8</tensao></enrolamento>'
+                     '</transformador>\n' % (nome, potencia / 1e6))
+        for nome, _, _ in rede.subestacoes:
+            if not pertence('subestacao', nome, subestacao):
+                continue
+            escrever('\t\t<subestacao nome="%s"/>\n' % nome)
+
+        escrever('\t</elementos>\n\t<topologia>\n')
+
+        for nome in rede.nos:
+            if not pertence('no', nome, subestacao):
+                continue
+            vizinhos, chaves = rede.dados_nos[nome][:2]
+            escrever('\t\t<elemento tipo="no" nome="%s"><vizinhos>%s</vizinhos><chaves>%s</chaves></elemento>\n'
+                     % (nome, _filhos('no', vizinhos), _filhos('chave', chaves)))
+        for nome in rede.setores:
+            if not pertence('setor', nome, subestacao):
+                continue
+            vizinhos, nos = rede.dados_setores[nome][:2]
+            escrever('\t\t<elemento tipo="setor" nome="%s"><vizinhos>%s</vizinhos><nos>%s</nos></elemento>\n'
+                     % (nome, _filhos('setor', vizinhos), _filhos('no', nos)))
+        for nome, _, setor_1, setor_2 in rede.chaves:
+            if not pertence('chave', nome, subestacao):
+                continue
+            escrever('\t\t<elemento tipo="chave" nome="%s"><n1>%s</n1><n2>%s</n2></elemento>\n'
+                     % (nome, _filhos('setor', [setor_1]), _filhos('setor', [setor_2])))
+        for nome, n1, n2, _, condutor in rede.trechos:
+            if not pertence('trecho', nome, subestacao):
+                continue
+            escrever('\t\t<elemento tipo="trecho" nome="%s"><n1><%s nome="%s"/></n1><n2><%s nome="%s"/></n2>'
+                     '<condutores><condutor nome="%s"/></condutores></elemento>\n'
+                     % ((nome,) + n1 + n2 + (condutor,)))
+        for nome, setores, trechos, chaves, raiz in rede.alimentadores:
+            if not pertence('alimentador', nome, subestacao):
+                continue
+            escrever('\t\t<elemento tipo="alimentador" nome="%s"><setores>%s</setores><trechos>%s</trechos>'
+                     '<chaves>%s</chaves><raiz><setor nome="%s"/></raiz></elemento>\n'
+                     % (nome, _filhos('setor', setores), _filhos('trecho', trechos),
+                        _filhos('chave', chaves), raiz))
+        for nome, alimentadores, transformadores in rede.subestacoes:
+            if not pertence('subestacao', nome, subestacao):
+                continue
+            escrever('\t\t<elemento tipo="subestacao" nome="%s"><alimentadores>%s</alimentadores>'
+                     '<transformadores>%s</transformadores></elemento>\n'
+                     % (nome, _filhos('alimentador', alimentadores), _filhos('transformador', transformadores)))
+
+        escrever('\t</topologia>\n\t<comunicacao>\n')
+
+        # endereços fictícios dos IEDs de cada chave
+        for i, (nome, _, _, _) in enumerate(rede.chaves):
+            if not pertence('chave', nome, subestacao):
+                continue
+            escrever('\t\t<elemento tipo="chave" nome="%s"><endereco><ip>10.%d.%d.%d</ip>'
+                     '<porta>%d</porta></endereco></elemento>\n'
+                     % (nome, (i >> 16) & 255, (i >> 8) & 255, i & 255, 5000 + i % 1000))
+
+        escrever('\t</comunicacao>\n</rede>\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gerador de redes sinteticas no formato xml')
+    parser.add_argument('arquivo')
+    parser.add_argument('--subestacoes', type=int, default=2)
+    parser.add_argument('--transformadores', type=int, default=1,
+                        help='transformadores por subestacao')
+    parser.add_argument('--alimentadores', type=int, default=2,
+                        help='alimentadores por subestacao')
+    parser.add_argument('--setores', type=int, default=5,
+                        help='setores por alimentador')
+    parser.add_argument('--nos', type=int, default=3,
+                        help='nos de carga por setor')
+    parser.add_argument('--densidade-na', type=float, default=0.2,
+                        help='chaves NA de interconexao por setor')
+    parser.add_argument('--distribuicao', choices=DISTRIBUICOES, default='uniforme')
+    parser.add_argument('--carga-media', type=float, default=None,
+                        help='W; sem ela, as cargas seguem --carregamento')
+    parser.add_argument('--carga-desvio', type=float, default=None, help='W')
+    parser.add_argument('--fator-de-potencia', type=float, default=0.95)
+    parser.add_argument('--folga-trafos', type=float, default=1.5)
+    parser.add_argument('--carregamento', type=float, default=0.5,
+                        help='fracao da ampacidade e da queda de tensao usada pelos alimentadores')
+    parser.add_argument('--semente', type=int, default=None)
+    parser.add_argument('--fragmentar', action='store_true',
+                        help='grava um fragmento xml por subestacao no diretorio arquivo')
+    args = parser.parse_args()
+
+    quantidades = gerar_rede(args.arquivo,
+                             subestacoes=args.subestacoes,
+                             transformadores=args.transformadores,
+                             alimentadores=args.alimentadores,
+                             setores=args.setores,
+                             nos=args.nos,
+                             densidade_na=args.densidade_na,
+                             distribuicao=args.distribuicao,
+                             carga_media=args.carga_media,
+                             carga_desvio=args.carga_desvio,
+                             fator_de_potencia=args.fator_de_potencia,
+                             folga_trafos=args.folga_trafos,
+                             carregamento=args.carregamento,
+                             semente=args.semente,
+                             fragmentar=args.fragmentar)
+
+    for tipo in sorted(quantidades.keys()):
+        print '%s: %d' % (tipo, quantidades[tipo])
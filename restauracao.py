@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+"""
+Estruturas usadas na restauração de ramos desenergizados pelos agentes
+alimentadores.
+
+EscalonadorDeRamos ordena os ramos podados (Poda) para a tentativa de
+restauração: maior prioridade média primeiro e, em caso de empate, maior
+carga, maior número de setores e, por fim, o nome do setor raiz, de
+modo que a ordem não depende da ordem de chegada dos ramos.
+
+Transacao registra as inserções e podas feitas em um alimentador durante
+a tentativa de restauração de um ramo, de modo que a tentativa possa ser
+desfeita, ou confirmada, notificando os outros agentes apenas do
+resultado final. Desfeita por completo, a transação restaura o estado
+guardado no início (cópias rasas, sem copiar os objetos do alimentador);
+desfeita até uma marca, executa as operações inversas.
+
+bisseccao encontra, com O(log n) avaliações, o menor número de setores
+que precisam ser podados de um ramo restaurado para que as restrições
+deixem de ser violadas. limite_inferior_de_poda restringe essa busca a
+partir de estimativas do alívio de cada violação obtido com cada poda.
+"""
+
+import heapq
+import itertools
+
+import numpy as np
+
+
+def chave_de_prioridade(ramo):
+    return (-ramo.prioridade_media,
+            -abs(ramo.carga_total),
+            -ramo.numero_de_setores,
+            ramo.raiz)
+
+
+def bisseccao(n, viavel, inicio=0):
+    """Menor k em [inicio + 1, n] para o qual viavel(k) é verdadeiro.
+
+    viavel deve ser monótona: falsa até um certo k e verdadeira a partir
+    dele. Supõe-se viavel(inicio) falso e viavel(n) verdadeiro, de modo
+    que nenhum dos dois é avaliado.
+    """
+    fim = n
+    while fim - inicio > 1:
+        meio = (inicio + fim) // 2
+        if viavel(meio):
+            fim = meio
+        else:
+            inicio = meio
+    return fim
+
+
+def limite_inferior_de_poda(necessarios, alivios):
+    """Menor k em [1, n] para o qual podar os k primeiros setores pode
+    eliminar todas as violações.
+
+    necessarios[v] é a redução necessária da violação v e alivios[v][s]
+    um limite superior da redução obtida podando o setor s, na ordem de
+    poda. Para k menor que o retornado, alguma violação certamente
+    permanece; n indica que nenhuma poda parcial basta.
+    """
+    alivios = np.asarray(alivios, dtype=np.float64)
+    n = alivios.shape[1]
+    suficientes = (np.cumsum(alivios, axis=1) >=
+                   np.asarray(necessarios, dtype=np.float64)[:, None]).all(axis=0)
+    if not suficientes[:n - 1].any():
+        return n
+    return int(np.argmax(suficientes)) + 1
+
+
+class EscalonadorDeRamos(object):
+    """Fila de prioridade de ramos baseada em heap.
+
+    inserir e retirar custam O(log n). atualizar recalcula a prioridade
+    de um ramo já escalonado (por exemplo após uma restauração parcial,
+    em que o ramo perdeu setores); a entrada antiga permanece no heap
+    marcada como removida e é descartada quando alcança o topo.
+    """
+
+    _REMOVIDO = object()
+
+    def __init__(self, ramos=()):
+        self._heap = list()
+        self._entradas = dict()
+        self._contador = itertools.count()
+        for ramo in ramos:
+            self.inserir(ramo)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def __contains__(self, ramo):
+        return id(ramo) in self._entradas
+
+    def inserir(self, ramo):
+        if id(ramo) in self._entradas:
+            self.remover(ramo)
+        entrada = [chave_de_prioridade(ramo), next(self._contador), ramo]
+        self._entradas[id(ramo)] = entrada
+        heapq.heappush(self._heap, entrada)
+
+    def atualizar(self, ramo):
+        self.inserir(ramo)
+
+    def remover(self, ramo):
+        entrada = self._entradas.pop(id(ramo))
+        entrada[-1] = self._REMOVIDO
+
+    def retirar(self):
+        """Retira e retorna o ramo de maior prioridade"""
+        while self._heap:
+            ramo = heapq.heappop(self._heap)[-1]
+            if ramo is not self._REMOVIDO:
+                del self._entradas[id(ramo)]
+                return ramo
+        raise IndexError('escalonador vazio')
+
+    def ordenados(self):
+        """Retira todos os ramos, em ordem de prioridade"""
+        return [self.retirar() for _ in range(len(self))]
+
+
+class Transacao(object):
+    """Registro das inserções e podas feitas em um alimentador
+    (AlimentadorIndexado), que podem ser confirmadas ou desfeitas em
+    ordem inversa.
+
+    As operações são tentativas: os outros agentes só são notificados
+    quando a transação é confirmada, e apenas do resultado final (a
+    inserção do ramo e o conjunto dos setores podados de volta).
+    notificar, se informado, é chamado como notificar(tipo, setores),
+    com os mesmos argumentos das mensagens R_02 entre os agentes.
+    Desfazer não gera notificações, pois os outros agentes não chegam a
+    ver as tentativas.
+
+    Também pode ser usada com with: a transação é desfeita se ocorrer
+    uma exceção, que é repassada, e confirmada caso contrário, se ainda
+    estiver ativa.
+
+    Como as operações do AlimentadorIndexado são feitas por completo ou
+    não são feitas, apenas as operações bem sucedidas são registradas.
+    Desfazer a transação por completo não depende delas: o alimentador
+    volta ao estado do início da transação (salvar_estado) e as chaves
+    dos ramos inseridos voltam aos estados que tinham antes da inserção.
+    """
+
+    def __init__(self, alimentador, notificar=None):
+        self.alimentador = alimentador
+        self.notificar = notificar
+        self.operacoes = list()
+        # número de setores no alimentador no início da transação
+        self.setores_iniciais = alimentador.rnp_inteira.shape[1]
+        # estado do alimentador no início da transação e estados das
+        # chaves dos ramos inseridos, que as podas podem alterar
+        self.estado_inicial = alimentador.salvar_estado()
+        self.estados_das_chaves = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, rastro):
+        if self.alimentador.transacao is not self:
+            return False
+        if tipo is None:
+            self.alimentador.confirmar_transacao()
+        else:
+            self.alimentador.desfazer_transacao()
+        return False
+
+    def marca(self):
+        """Marca o estado atual, para desfazer(ate=marca)"""
+        return len(self.operacoes)
+
+    def alterou(self):
+        return self.alimentador.rnp_inteira.shape[1] != self.setores_iniciais
+
+    def inserir_ramo(self, no, ramo, no_raiz):
+        estados = [(chave, chave.estado) for chave in ramo.chaves.values()]
+        self.alimentador.inserir_ramo(no, ramo, no_raiz)
+        self.estados_das_chaves.extend(estados)
+        self.operacoes.append(('insercao', no, ramo, no_raiz))
+
+    def podar(self, setor):
+        caminho = self.alimentador.caminho_ate_raiz(setor)
+        pai = self.alimentador.nomes(caminho[1:2])[0]
+        poda = self.alimentador.podar(setor, alterar_rnp=True)
+        self.operacoes.append(('poda', pai, poda, setor))
+        return poda
+
+    def desfazer(self, ate=0):
+        """Desfaz as operações registradas, da última para a primeira,
+        até restarem as ate primeiras operações. Os ramos inseridos voltam
+        a ser podas: os mesmos objetos Poda passam a conter o ramo podado
+        novamente. Com ate igual a zero, o estado do início da transação é
+        restaurado diretamente; os objetos Poda inseridos não foram
+        alterados pela inserção.
+        """
+        if ate == 0:
+            self.operacoes = list()
+            for chave, estado in reversed(self.estados_das_chaves):
+                chave.estado = estado
+            self.estados_das_chaves = list()
+            self.alimentador.restaurar_estado(self.estado_inicial)
+            return
+
+        while len(self.operacoes) > ate:
+            # a operação só sai do registro depois de desfeita: se a
+            # operação inversa falhar, o alimentador não é alterado e o
+            # registro continua de acordo com ele
+            tipo, no, ramo, setor = self.operacoes[-1]
+            if tipo == 'poda':
+                self.alimentador.inserir_ramo(no, ramo, setor)
+            else:
+                ramo.substituir(self.alimentador.podar(setor, alterar_rnp=True))
+            self.operacoes.pop()
+
+    def confirmar(self):
+        """Encerra a transação notificando o seu resultado e retorna as
+        podas feitas nela
+        """
+        mensagens = list()
+        for tipo, no, ramo, setor in self.operacoes:
+            if tipo == 'insercao':
+                mensagens.append(('insercao', (no, setor)))
+            elif mensagens and mensagens[-1][0] == 'poda':
+                # podas consecutivas seguem em uma única mensagem
+                mensagens[-1][1].append(setor)
+            else:
+                mensagens.append(('poda', [setor]))
+
+        if self.notificar is not None:
+            for tipo, setores in mensagens:
+                self.notificar(tipo, setores)
+
+        podas = [ramo for tipo, _, ramo, _ in self.operacoes if tipo == 'poda']
+        self.operacoes = list()
+        return podas
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+
+"""
+Armazenamento compartilhado da topologia da rede entre os agentes
+alimentadores de um mesmo processo.
+
+O ArmazemTopologia carrega a rede uma única vez e entrega a cada agente
+uma VisaoTopologia: um dicionário com as mesmas chaves retornadas por
+carregar_topologia, em que os alimentadores do próprio agente são cópias
+privadas e os demais alimentadores são os objetos compartilhados do
+armazém, que só são copiados para a visão quando o agente precisa
+alterá-los (cópia na escrita).
+
+O armazém também pode ser recarregado a partir do arquivo: a nova
+topologia é comparada com a lida anteriormente (DiferencaTopologia) e
+cada visão é sincronizada aplicando apenas o que mudou. A comparação usa
+o ResumoTopologia de cada leitura, calculado ao ler o arquivo, e não
+depende do estado dos objetos. Alterações de parâmetros (cargas, estados
+de chaves, condutores) são aplicadas nos próprios objetos das visões,
+sem alterar a RNP dos alimentadores; apenas os alimentadores com
+alterações estruturais são gerados novamente. Os estados das chaves
+operadas pelo agente e das chaves dos ramos podados não são alterados.
+"""
+
+import copy
+import os
+
+from fluxo_de_carga import descartar_rede_radial
+from xml2objects import carregar_topologia, ARQUIVO_PADRAO
+
+
+class ArmazemTopologia(object):
+    """Topologia carregada uma única vez e compartilhada pelas visões
+    dos agentes do processo. Os objetos do armazém nunca são alterados
+    pelas visões.
+    """
+
+    def __init__(self, arquivo=None, **kwargs):
+        self.arquivo = arquivo
+        # parâmetros repassados para carregar_topologia
+        self.kwargs = kwargs
+        self._topologia = None
+        # resumo da última leitura do arquivo, com o qual a próxima é comparada
+        self._resumo = None
+        # diferenças aplicadas por recarregar, a versão da topologia
+        # corrente é o número de diferenças
+        self.historico = list()
+
+    @property
+    def topologia(self):
+        if self._topologia is None:
+            self._topologia = carregar_topologia(self.arquivo, **self.kwargs)
+            self._resumo = ResumoTopologia(self._topologia)
+        return self._topologia
+
+    @property
+    def versao(self):
+        return len(self.historico)
+
+    def recarregar(self):
+        """Lê novamente o arquivo e, caso a topologia tenha mudado,
+        substitui a topologia do armazém pela nova e retorna a
+        DiferencaTopologia entre elas. Retorna None se não houver mudança.
+        """
+        if self._topologia is None:
+            self.topologia
+            return None
+
+        nova = carregar_topologia(self.arquivo, **self.kwargs)
+        resumo = ResumoTopologia(nova)
+        diferenca = comparar_resumos(self._resumo, resumo)
+        if diferenca.vazia():
+            return None
+
+        self._topologia, self._resumo = nova, resumo
+        self.historico.append(diferenca)
+        return diferenca
+
+    def diferenca_desde(self, versao):
+        """União das diferenças aplicadas após a versão informada,
+        ou None se a versão for a corrente.
+        """
+        if versao == self.versao:
+            return None
+        diferenca = DiferencaTopologia()
+        for i in self.historico[versao:]:
+            diferenca.unir(i)
+        return diferenca
+
+    def visao(self, alimentadores_proprios):
+        """Retorna uma VisaoTopologia em que os alimentadores de nomes
+        informados em alimentadores_proprios são cópias privadas.
+        """
+        return VisaoTopologia(self, alimentadores_proprios)
+
+    def copiar_alimentador(self, nome):
+        """Cópia profunda do alimentador nome do armazém. Os objetos de
+        outros alimentadores alcançáveis a partir dele (setores vizinhos
+        de chaves de fronteira, por exemplo) não são copiados. As chaves
+        de fronteira, que também pertencem aos alimentadores vizinhos,
+        são copiadas com o alimentador, pois podar e inserir_ramo alteram
+        o seu estado; cópias diferentes da mesma chave são identificadas
+        pelo nome (AlimentadorIndexado.inserir_ramo).
+        """
+        topologia = self.topologia
+        alimentador = topologia['alimentadores'][nome]
+
+        memo = dict()
+        for outro in topologia['alimentadores'].values():
+            if outro is not alimentador:
+                memo[id(outro)] = outro
+        for setor in topologia['setores'].values():
+            if setor.nome not in alimentador.setores:
+                memo[id(setor)] = setor
+        for no in topologia['nos'].values():
+            if no.nome not in alimentador.nos_de_carga:
+                memo[id(no)] = no
+        for objeto in topologia['subestacoes'].values() + topologia['transformadores'].values():
+            memo[id(objeto)] = objeto
+
+        return copy.deepcopy(alimentador, memo)
+
+
+class VisaoTopologia(dict):
+    """Visão da topologia de um agente.
+
+    Os dicionários 'alimentadores' e 'subestacoes' são próprios da visão;
+    os demais ('chaves', 'nos', 'setores', ...) são os do armazém e devem
+    ser tratados como somente leitura.
+    """
+
+    def __init__(self, armazem, alimentadores_proprios):
+        topologia = armazem.topologia
+        super(VisaoTopologia, self).__init__(topologia)
+        self.armazem = armazem
+        self['alimentadores'] = dict(topologia['alimentadores'])
+        self['subestacoes'] = dict(topologia['subestacoes'])
+        self.privados = set()
+        self.versao = armazem.versao
+        # alimentadores privados com alteração estrutural ainda não aplicada
+        self.pendentes = set()
+
+        for nome in alimentadores_proprios:
+            self.alimentador_mutavel(nome)
+
+    def alimentador_mutavel(self, nome):
+        """Retorna o alimentador nome pronto para ser alterado pelo
+        agente, copiando-o do armazém no primeiro acesso.
+        """
+        if nome in self.privados:
+            return self['alimentadores'][nome]
+
+        alimentador = self.armazem.copiar_alimentador(nome)
+        self['alimentadores'][nome] = alimentador
+        self.privados.add(nome)
+
+        # as subestações da visão que contêm o alimentador passam a ser
+        # cópias rasas que apontam para a cópia privada
+        for sub_nome, sub in self['subestacoes'].items():
+            if nome not in sub.alimentadores:
+                continue
+            if sub is self.armazem.topologia['subestacoes'][sub_nome]:
+                sub = copy.copy(sub)
+                sub.alimentadores = dict(sub.alimentadores)
+                self['subestacoes'][sub_nome] = sub
+            sub.alimentadores[nome] = alimentador
+
+        return alimentador
+
+    def sincronizar(self, podas=(), adiar=()):
+        """Aplica na visão as diferenças da topologia do armazém desde a
+        última sincronização e retorna a DiferencaTopologia aplicada,
+        ou None se a visão já estiver atualizada.
+
+        Os parâmetros alterados são atualizados nos objetos dos
+        alimentadores privados, inclusive nos setores podados guardados
+        em podas. O estado de uma chave só é atualizado se ela não
+        pertencer a um ramo de podas e se ainda tiver o estado lido
+        anteriormente do arquivo, ou seja, se não foi operada pelo
+        agente. Os alimentadores privados com alteração estrutural são
+        copiados novamente do armazém, exceto os informados em adiar,
+        que continuam pendentes até uma próxima sincronização.
+        """
+        diferenca = self.armazem.diferenca_desde(self.versao)
+        if diferenca is None and not self.pendentes - set(adiar):
+            return None
+        if diferenca is None:
+            diferenca = DiferencaTopologia()
+
+        nova = self.armazem.topologia
+        self.versao = self.armazem.versao
+
+        # dicionários compartilhados passam a ser os da nova topologia
+        for tipo in nova:
+            if tipo not in ('alimentadores', 'subestacoes'):
+                self[tipo] = nova[tipo]
+
+        self.pendentes |= diferenca.alimentadores_afetados & self.privados
+
+        alimentadores = dict(nova['alimentadores'])
+        for nome in list(self.privados):
+            if nome not in alimentadores:
+                self.privados.discard(nome)
+                self.pendentes.discard(nome)
+            elif nome in self.pendentes and nome not in adiar:
+                alimentadores[nome] = self.armazem.copiar_alimentador(nome)
+                self.pendentes.discard(nome)
+            else:
+                alimentadores[nome] = self['alimentadores'][nome]
+                _atualizar_parametros(alimentadores[nome], diferenca, nova, podas)
+        self['alimentadores'] = alimentadores
+
+        # subestações que contêm alimentadores privados são copiadas
+        # novamente, apontando para as cópias privadas
+        subestacoes = dict(nova['subestacoes'])
+        for sub_nome, sub in subestacoes.items():
+            if self.privados & set(sub.alimentadores):
+                sub = copy.copy(sub)
+                sub.alimentadores = dict(sub.alimentadores)
+                for nome in self.privados & set(sub.alimentadores):
+                    sub.alimentadores[nome] = alimentadores[nome]
+                subestacoes[sub_nome] = sub
+        self['subestacoes'] = subestacoes
+
+        return diferenca
+
+
+def _atualizar_parametros(alimentador, diferenca, nova, podas):
+    # atualiza os parâmetros alterados nos objetos do alimentador e nos
+    # setores podados, sem alterar a estrutura (RNP) do alimentador
+    setores = dict(alimentador.setores)
+    chaves_das_podas = set()
+    for poda in podas:
+        setores.update(poda.setores)
+        chaves_das_podas.update(poda.chaves)
+    nos = dict(alimentador.nos_de_carga)
+    for setor in setores.values():
+        nos.update(setor.nos_de_carga)
+
+    for nome in diferenca.parametros['nos'] & set(nos):
+        nos[nome].potencia = nova['nos'][nome].potencia
+    if diferenca.parametros['nos'] & set(alimentador.nos_de_carga):
+        alimentador.invalidar_potencias()
+    for nome in diferenca.parametros['setores'] & set(setores):
+        setores[nome].prioridade = nova['setores'][nome].prioridade
+    # o estado das chaves dos ramos podados e das chaves operadas pela
+    # restauração pertence ao agente
+    for nome in (diferenca.parametros['chaves'] & set(alimentador.chaves)) - chaves_das_podas:
+        chave = alimentador.chaves[nome]
+        if (chave.estado,) == diferenca.anteriores['chaves'][nome]:
+            chave.estado = nova['chaves'][nome].estado
+    trechos = diferenca.parametros['trechos'] & set(alimentador.trechos)
+    for nome in trechos:
+        trecho, novo = alimentador.trechos[nome], nova['trechos'][nome]
+        trecho.condutor = novo.condutor
+        trecho.comprimento = novo.comprimento
+    if trechos:
+        # as impedâncias da rede radial do fluxo de carga mudaram
+        descartar_rede_radial(alimentador)
+
+    for poda in podas:
+        poda.atualizar_agregados()
+
+
+class DiferencaTopologia(object):
+    """Diferença entre duas topologias, com os nomes dos elementos
+    adicionados, removidos e alterados de cada tipo.
+
+    Os elementos alterados são separados em parametros (apenas
+    grandezas elétricas, estado ou prioridade mudaram) e estruturais
+    (ligações mudaram); anteriores guarda os parâmetros que os elementos
+    de parametros tinham na topologia antiga. alimentadores_afetados
+    contém os alimentadores que precisam ser gerados novamente por causa
+    de alterações estruturais em qualquer um de seus elementos.
+    """
+
+    TIPOS = ('nos', 'setores', 'chaves', 'trechos', 'alimentadores',
+             'transformadores', 'subestacoes')
+
+    def __init__(self):
+        self.adicionados = dict((tipo, set()) for tipo in self.TIPOS)
+        self.removidos = dict((tipo, set()) for tipo in self.TIPOS)
+        self.parametros = dict((tipo, set()) for tipo in self.TIPOS)
+        self.estruturais = dict((tipo, set()) for tipo in self.TIPOS)
+        self.anteriores = dict((tipo, dict()) for tipo in self.TIPOS)
+        self.alimentadores_afetados = set()
+
+    def vazia(self):
+        return not any(any(i.values()) for i in (self.adicionados, self.removidos,
+                                                 self.parametros, self.estruturais))
+
+    def unir(self, outra):
+        for campo in ('adicionados', 'removidos', 'parametros', 'estruturais'):
+            for tipo, nomes in getattr(outra, campo).items():
+                getattr(self, campo)[tipo] |= nomes
+        # as diferenças são unidas em ordem: vale o parâmetro mais antigo
+        for tipo, anteriores in outra.anteriores.items():
+            for nome, parametros in anteriores.items():
+                self.anteriores[tipo].setdefault(nome, parametros)
+        self.alimentadores_afetados |= outra.alimentadores_afetados
+
+    def __repr__(self):
+        partes = []
+        for campo in ('adicionados', 'removidos', 'parametros', 'estruturais'):
+            for tipo in self.TIPOS:
+                if getattr(self, campo)[tipo]:
+                    partes.append('%s %s: %d' % (campo, tipo, len(getattr(self, campo)[tipo])))
+        return '<DiferencaTopologia %s>' % (', '.join(partes) or 'vazia')
+
+
+# assinaturas (estrutura, parametros) de cada tipo de elemento
+_ASSINATURAS = {
+    'nos': lambda no: ((sorted(no.vizinhos), sorted(no.chaves)),
+                       (no.potencia.real, no.potencia.imag)),
+    'setores': lambda setor: ((sorted(setor.vizinhos), sorted(setor.nos_de_carga)),
+                              (setor.prioridade,)),
+    'chaves': lambda chave: ((chave.n1.nome, chave.n2.nome),
+                             (chave.estado,)),
+    'trechos': lambda trecho: ((trecho.n1.nome, trecho.n2.nome),
+                               (trecho.comprimento, trecho.condutor.nome, trecho.condutor.rp,
+                                trecho.condutor.xp, trecho.condutor.ampacidade)),
+    'alimentadores': lambda al: ((sorted(al.setores), sorted(al.trechos), sorted(al.chaves),
+                                  getattr(al, 'raiz', None)),
+                                 ()),
+    'transformadores': lambda trafo: ((),
+                                      (trafo.potencia.mod, trafo.impedancia.real,
+                                       trafo.impedancia.imag)),
+    'subestacoes': lambda sub: ((sorted(sub.alimentadores), sorted(sub.transformadores)),
+                                ()),
+}
+
+# atributo de Alimentador com os elementos de cada tipo
+_MEMBROS = {'nos': 'nos_de_carga', 'setores': 'setores', 'chaves': 'chaves', 'trechos': 'trechos'}
+
+
+class ResumoTopologia(object):
+    """Assinaturas (estrutura, parametros) dos elementos de uma topologia
+    gerada por carregar_topologia e elementos de cada alimentador e de
+    cada subestação. São valores copiados dos objetos: alterações feitas
+    nos objetos depois de calculado o resumo não o alteram.
+    """
+
+    def __init__(self, topologia):
+        self.assinaturas = dict(
+            (tipo, dict((nome, assinatura(objeto)) for nome, objeto in topologia[tipo].items()))
+            for tipo, assinatura in _ASSINATURAS.items())
+        self.membros = dict(
+            (nome, dict((tipo, frozenset(getattr(alimentador, atributo)))
+                        for tipo, atributo in _MEMBROS.items()))
+            for nome, alimentador in topologia['alimentadores'].items())
+        self.alimentadores_das_subestacoes = dict(
+            (nome, frozenset(sub.alimentadores))
+            for nome, sub in topologia['subestacoes'].items())
+
+
+def comparar_topologias(antiga, nova):
+    """Retorna a DiferencaTopologia entre duas topologias geradas por
+    carregar_topologia.
+    """
+    return comparar_resumos(ResumoTopologia(antiga), ResumoTopologia(nova))
+
+
+def comparar_resumos(antigo, novo):
+    """Retorna a DiferencaTopologia entre as topologias dos dois
+    ResumoTopologia.
+    """
+    diferenca = DiferencaTopologia()
+
+    for tipo in _ASSINATURAS:
+        antigas, novas = antigo.assinaturas[tipo], novo.assinaturas[tipo]
+        nomes_antigos, nomes_novos = set(antigas), set(novas)
+        diferenca.adicionados[tipo] = nomes_novos - nomes_antigos
+        diferenca.removidos[tipo] = nomes_antigos - nomes_novos
+        for nome in nomes_antigos & nomes_novos:
+            estrutura_antiga, parametros_antigos = antigas[nome]
+            estrutura_nova, parametros_novos = novas[nome]
+            if estrutura_antiga != estrutura_nova:
+                diferenca.estruturais[tipo].add(nome)
+            elif parametros_antigos != parametros_novos:
+                diferenca.parametros[tipo].add(nome)
+                diferenca.anteriores[tipo][nome] = parametros_antigos
+
+    # alimentadores que contêm, antes ou depois da alteração,
+    # algum elemento adicionado, removido ou alterado estruturalmente
+    afetados = diferenca.alimentadores_afetados
+    for tipo in ('alimentadores', 'subestacoes'):
+        for nome in diferenca.adicionados[tipo] | diferenca.removidos[tipo] | diferenca.estruturais[tipo]:
+            if tipo == 'alimentadores':
+                afetados.add(nome)
+            else:
+                for resumo in (antigo, novo):
+                    afetados |= resumo.alimentadores_das_subestacoes.get(nome, frozenset())
+
+    for resumo in (antigo, novo):
+        for nome, membros in resumo.membros.items():
+            if nome in afetados:
+                continue
+            for tipo in _MEMBROS:
+                alterados = (diferenca.adicionados[tipo] | diferenca.removidos[tipo] |
+                             diferenca.estruturais[tipo])
+                if alterados and not alterados.isdisjoint(membros[tipo]):
+                    afetados.add(nome)
+                    break
+
+    return diferenca
+
+
+# armazéns do processo, indexados pelo caminho absoluto do arquivo
+_armazens = dict()
+
+
+def obter_armazem(arquivo=None):
+    """Retorna o ArmazemTopologia do processo para o arquivo,
+    criando-o na primeira chamada.
+    """
+    caminho = os.path.abspath(arquivo or ARQUIVO_PADRAO)
+    armazem = _armazens.get(caminho)
+    if armazem is None:
+        armazem = ArmazemTopologia(caminho)
+        _armazens[caminho] = armazem
+    return armazem
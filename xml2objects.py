@@ -13,51 +13,245 @@ O código em xml deve ter a seguinte estrutura:
         <subestacao/>...
     </elementos>
     <topologia>
-        <elemento tipo="chave"/>
         <elemento tipo="no"/>
         <elemento tipo="setor"/>
+        <elemento tipo="chave"/>
+        <elemento tipo="trecho"/>
         <elemento tipo="alimentador"/>
         <elemento tipo="transformador">
         <elemento tipo="subestacao"/>
     </topologia>
 </rede>
+Na leitura em fluxo (leitor='iterparse') a ordem dos elementos dentro
+de <topologia> não importa: os objetos são gerados ao final da leitura,
+na ordem de ORDEM_TOPOLOGIA.
 """
 
 # importaçoes necessárias
-from rede import Chave, Setor, Condutor, Trecho, Alimentador, NoDeCarga, Subestacao, Transformador, Fasor
-from bs4 import BeautifulSoup
-from collections import namedtuple
-
-# carraga o arquivo com as definições em xml
-f = open('rede_2.xml')
-
-# gera o objeto para iteração em xml do BeautifulSoup
-rede = BeautifulSoup(f)
-
-elementos = rede.find_all('elementos')[0]
-topo = rede.find_all('topologia')[0]
-com = rede.find_all('comunicacao')[0]
-
-
-def carregar_topologia(arquivo=None):
-    global rede, elementos, topo, com
-    if arquivo is not None:
-        f = open(arquivo)
-        rede = BeautifulSoup(f)
-        elementos = rede.find_all('elementos')[0]
-        topo = rede.find_all('topologia')[0]
-        com = rede.find_all('comunicacao')[0]
-
-    chaves = _gerar_chaves()
-    nos = _gerar_nos_de_carga()
-    setores = _gerar_setores(nos)
-    _associar_chaves_aos_setores(chaves, setores)
-    condutores = _gerar_condutores()
-    trechos = _gerar_trechos(nos, chaves, condutores)
-    alimentadores = _gerar_alimentadores(setores, trechos, chaves)
-    transformadores = _gerar_transformadores()
-    subestacoes = _gerar_subestacaoes(alimentadores, transformadores)
-    comunicacao = _gerar_comunicacao()
+# os objetos de rede verificam o tipo dos fasores e só operam com
+# rede.Fasor, por isso a topologia é gerada com rede.Fasor
+from rede import Chave, Setor, Condutor, Trecho, NoDeCarga, Subestacao, Transformador, Fasor
+from alimentador_indexado import AlimentadorIndexado
+from collections import namedtuple, OrderedDict
+
+import cPickle as pickle
+import glob
+import hashlib
+import multiprocessing
+import os
+
+try:
+    from lxml.etree import iterparse
+except ImportError:
+    from xml.etree.cElementTree import iterparse
+
+# arquivo carregado quando nenhum outro é informado, procurado no
+# diretório deste módulo e não no diretório de trabalho do processo
+ARQUIVO_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rede_2.xml')
+
+# versão do formato dos snapshots binários da topologia. Deve ser
+# incrementada sempre que a estrutura dos objetos gerados mudar, para
+# que snapshots antigos sejam descartados
+VERSAO_SNAPSHOT = 7
+
+Comunicacao = namedtuple('Comunicacao', ['nome', 'ip', 'porta'])
+
+
+class DocumentoRede(object):
+    """Documento xml de rede interpretado pelo BeautifulSoup.
+
+    Guarda as tags <elementos>, <topologia> e <comunicacao> e o índice
+    (tipo, nome) da topologia, de forma que o mesmo arquivo possa ser
+    usado para gerar os objetos da rede várias vezes sem ser lido de novo.
+    """
+
+    def __init__(self, arquivo):
+        # o BeautifulSoup só é importado quando um documento é de fato lido
+        from bs4 import BeautifulSoup
+
+        self.arquivo = arquivo
+        self.modificacao = os.path.getmtime(arquivo)
+
+        # gera o objeto para iteração em xml do BeautifulSoup
+        with open(arquivo) as f:
+            self.rede = BeautifulSoup(f)
+
+        self.elementos = self.rede.find_all('elementos')[0]
+        self.topo = self.rede.find_all('topologia')[0]
+        self.com = self.rede.find_all('comunicacao')[0]
+        self._indice = None
+
+    @property
+    def indice(self):
+        if self._indice is None:
+            self._indice = _indexar_topologia(self.topo)
+        return self._indice
+
+    def desatualizado(self):
+        return os.path.getmtime(self.arquivo) != self.modificacao
+
+
+# documentos já interpretados, indexados pelo caminho absoluto do
+# arquivo, do menos para o mais recentemente usado
+_documentos = OrderedDict()
+
+# número máximo de documentos mantidos em _documentos
+MAX_DOCUMENTOS = 4
+
+
+def abrir_documento(arquivo=None):
+    """Retorna o DocumentoRede do arquivo, interpretando-o apenas na
+    primeira chamada ou quando o arquivo tiver sido modificado.
+
+    São mantidos apenas os MAX_DOCUMENTOS documentos usados mais
+    recentemente.
+    """
+    caminho = os.path.abspath(arquivo or ARQUIVO_PADRAO)
+    documento = _documentos.pop(caminho, None)
+    if documento is None or documento.desatualizado():
+        documento = DocumentoRede(caminho)
+    _documentos[caminho] = documento
+    while len(_documentos) > MAX_DOCUMENTOS:
+        _documentos.popitem(last=False)
+    return documento
+
+
+def descartar_documentos(arquivo=None):
+    """Descarta o documento do arquivo ou, sem arquivo, todos os
+    documentos já interpretados
+    """
+    if arquivo is None:
+        _documentos.clear()
+    else:
+        _documentos.pop(os.path.abspath(arquivo), None)
+
+
+def carregar_topologia(arquivo=None, leitor='bs4', snapshot=True, processos=None):
+    """Carrega a rede descrita em xml e retorna um dicionario com os
+    objetos gerados, indexados pelo tipo de elemento.
+
+    O parametro leitor define o backend de leitura do arquivo:
+    'bs4' monta a arvore completa do documento com o BeautifulSoup e
+    'iterparse' le o arquivo em fluxo, gerando os objetos durante a
+    leitura e descartando cada elemento xml logo apos o seu uso.
+    Nenhum arquivo e lido antes da chamada desta funcao.
+
+    Com snapshot=True a topologia ja ordenada e gravada em um arquivo
+    binario ao lado do xml, identificado pelo hash do xml. Nas proximas
+    chamadas, se o hash for o mesmo, a topologia e lida diretamente do
+    snapshot, sem interpretar o xml nem ordenar os alimentadores.
+
+    O arquivo tambem pode ser um diretorio ou um manifesto (qualquer
+    arquivo sem extensao .xml, com o caminho de um fragmento por linha,
+    relativo ao manifesto) de fragmentos xml, um por subestacao. Os
+    fragmentos sao sempre lidos em fluxo, em paralelo, em um pool de
+    processos (com processos=None, um por nucleo), e as chaves de
+    interconexao entre fragmentos sao resolvidas ao final, na etapa
+    de ligacao.
+    """
+    arquivo = os.path.abspath(arquivo or ARQUIVO_PADRAO)
+    fragmentos = _listar_fragmentos(arquivo)
+
+    if fragmentos is None:
+        def gerar():
+            return _gerar_topologia(arquivo, leitor)
+    else:
+        def gerar():
+            return _carregar_topologia_fragmentada(fragmentos, processos)
+
+    if not snapshot:
+        return gerar()
+
+    assinatura = _calcular_assinatura(fragmentos or [arquivo])
+    topologia = _ler_snapshot(arquivo, assinatura)
+    if topologia is None:
+        topologia = gerar()
+        _gravar_snapshot(arquivo, assinatura, topologia)
+    return topologia
+
+
+def _listar_fragmentos(arquivo):
+    # retorna a lista de fragmentos de um diretorio ou manifesto,
+    # ou None caso arquivo seja um unico arquivo xml
+    if os.path.isdir(arquivo):
+        return sorted(glob.glob(os.path.join(arquivo, '*.xml')))
+    if os.path.splitext(arquivo)[1].lower() == '.xml':
+        return None
+    diretorio = os.path.dirname(arquivo)
+    with open(arquivo) as f:
+        linhas = [linha.strip() for linha in f]
+    return [os.path.join(diretorio, linha) for linha in linhas
+            if linha and not linha.startswith('#')]
+
+
+def _calcular_assinatura(arquivos):
+    # hash sha1 do conteudo dos arquivos xml
+    sha1 = hashlib.sha1()
+    for arquivo in arquivos:
+        sha1.update(os.path.basename(arquivo))
+        with open(arquivo, 'rb') as f:
+            for bloco in iter(lambda: f.read(1 << 16), b''):
+                sha1.update(bloco)
+    return sha1.hexdigest()
+
+
+def _caminho_snapshot(arquivo):
+    return arquivo + '.snapshot'
+
+
+def _ler_snapshot(arquivo, assinatura):
+    # retorna a topologia gravada no snapshot ou None caso o snapshot
+    # nao exista, seja de outra versao ou de outro conteudo de xml
+    caminho = _caminho_snapshot(arquivo)
+    if not os.path.exists(caminho):
+        return None
+    try:
+        with open(caminho, 'rb') as f:
+            # o cabecalho e gravado separadamente para que snapshots
+            # invalidos sejam descartados sem ler o grafo de objetos
+            if pickle.load(f) != (VERSAO_SNAPSHOT, assinatura):
+                print 'Snapshot %s desatualizado.' % caminho
+                return None
+            topologia = pickle.load(f)
+    except Exception as erro:
+        print 'Snapshot %s invalido: %s' % (caminho, erro)
+        return None
+    print 'Topologia carregada do snapshot %s.' % caminho
+    return topologia
+
+
+def _gravar_snapshot(arquivo, assinatura, topologia):
+    caminho = _caminho_snapshot(arquivo)
+    temporario = '%s.%d.tmp' % (caminho, os.getpid())
+    try:
+        with open(temporario, 'wb') as f:
+            pickle.dump((VERSAO_SNAPSHOT, assinatura), f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(topologia, f, pickle.HIGHEST_PROTOCOL)
+        # a troca do arquivo e atomica, um processo lendo o snapshot
+        # nunca encontra um arquivo gravado pela metade
+        os.rename(temporario, caminho)
+    except (IOError, OSError, pickle.PicklingError) as erro:
+        print 'Nao foi possivel gravar o snapshot %s: %s' % (caminho, erro)
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def _gerar_topologia(arquivo, leitor):
+    if leitor == 'iterparse':
+        return _carregar_topologia_iterparse(arquivo)
+
+    doc = abrir_documento(arquivo)
+
+    chaves = _gerar_chaves(doc)
+    nos = _gerar_nos_de_carga(doc)
+    setores = _gerar_setores(doc, nos)
+    _associar_chaves_aos_setores(doc, chaves, setores)
+    condutores = _gerar_condutores(doc)
+    trechos = _gerar_trechos(doc, nos, chaves, condutores)
+    alimentadores = _gerar_alimentadores(doc, setores, trechos, chaves)
+    transformadores = _gerar_transformadores(doc)
+    subestacoes = _gerar_subestacaoes(doc, alimentadores, transformadores)
+    comunicacao = _gerar_comunicacao(doc)
     return {'chaves': chaves,
             'nos': nos,
             'setores': setores,
@@ -68,10 +262,19 @@ def carregar_topologia(arquivo=None):
             'comunicacao': comunicacao}
 
 
-def _gerar_chaves():
+def _indexar_topologia(topo):
+    # Indexacao dos elementos da topologia pelo par (tipo, nome),
+    # feita em uma unica passagem sobre a tag <topologia>
+    indice = dict()
+    for elemento_tag in topo.find_all('elemento'):
+        indice[(elemento_tag['tipo'], elemento_tag['nome'])] = elemento_tag
+    return indice
+
+
+def _gerar_chaves(doc):
     # Busca e instanciamento dos objetos do tipo Chave
     print 'Gerando chaves...'
-    chaves_xml = elementos.find_all('chave')
+    chaves_xml = doc.elementos.find_all('chave')
     chaves = dict()
     for chave_tag in chaves_xml:
         if chave_tag['estado'] == 'fechado':
@@ -83,13 +286,13 @@ def _gerar_chaves():
     return chaves
 
 
-def _gerar_nos_de_carga():
+def _gerar_nos_de_carga(doc):
     # Busca e instanciamento dos objetos do tipo NoDeCarga
     print 'Gerando Nos de Carga...'
-    nos_xml = elementos.find_all('no')
+    nos_xml = doc.elementos.find_all('no')
     nos = dict()
     for no_tag in nos_xml:
-        elemento_tag = topo.find_all('elemento', tipo='no', nome=no_tag['nome'])[0]
+        elemento_tag = doc.indice[('no', no_tag['nome'])]
         vizinhos = [no['nome'] for no in elemento_tag.vizinhos.findChildren('no')]
         chaves_do_no = [chave['nome']
                         for chave in elemento_tag.chaves.findChildren('chave')]
@@ -120,18 +323,17 @@ def _gerar_nos_de_carga():
     return nos
 
 
-def _gerar_setores(nos):
+def _gerar_setores(doc, nos):
     # Busca e instanciamento dos objetos do tipo Setor
     print 'Gerando Setores...'
-    setores_xml = elementos.find_all('setor')
+    setores_xml = doc.elementos.find_all('setor')
     setores = dict()
 
     for setor_tag in setores_xml:
-        elemento_tag = topo.find_all(
-            'elemento', tipo='setor', nome=setor_tag['nome'])[0]
+        elemento_tag = doc.indice[('setor', setor_tag['nome'])]
         vizinhos_do_setor = [setor['nome'] for setor in elemento_tag.findChildren('setor')]
         nomes_nos_do_setor = [no['nome'] for no in elemento_tag.findChildren('no')]
-        nos_do_setor = [no for no in nos.values() if no.nome in nomes_nos_do_setor]
+        nos_do_setor = [nos[nome] for nome in nomes_nos_do_setor]
         setores[setor_tag['nome']] = Setor(nome=setor_tag['nome'],
                                            vizinhos=vizinhos_do_setor,
                                            nos_de_carga=nos_do_setor,
@@ -140,18 +342,18 @@ def _gerar_setores(nos):
     return setores
 
 
-def _associar_chaves_aos_setores(chaves, setores):
+def _associar_chaves_aos_setores(doc, chaves, setores):
     # Associação das chaves aos setores
     for chave in chaves.values():
-        elemento_chave = topo.find_all('elemento', tipo='chave', nome=chave.nome)[0]
+        elemento_chave = doc.indice[('chave', chave.nome)]
         chave.n1 = setores[elemento_chave.n1.setor['nome']]
         chave.n2 = setores[elemento_chave.n2.setor['nome']]
 
 
-def _gerar_condutores():
+def _gerar_condutores(doc):
     # Busca e instanciamento dos objetos do tipo Condutor
     print 'Gerando Condutores...'
-    condutores_xml = elementos.find_all('condutor')
+    condutores_xml = doc.elementos.find_all('condutor')
     condutores = dict()
 
     for condutor_tag in condutores_xml:
@@ -164,15 +366,15 @@ def _gerar_condutores():
     return condutores
 
 
-def _gerar_trechos(nos, chaves, condutores):
+def _gerar_trechos(doc, nos, chaves, condutores):
     # Busca e instanciamento dos objetos do tipo Alimentador
     print 'Gerando Trechos...'
-    trechos_xml = elementos.find_all('trecho')
+    trechos_xml = doc.elementos.find_all('trecho')
     trechos = dict()
 
     for trecho_tag in trechos_xml:
         print trecho_tag['nome']
-        elemento_tag = topo.find_all('elemento', tipo='trecho', nome=trecho_tag['nome'])[0]
+        elemento_tag = doc.indice[('trecho', trecho_tag['nome'])]
         if elemento_tag.n1.no is not None:
             n1 = nos[elemento_tag.n1.no['nome']]
         elif elemento_tag.n1.chave is not None:
@@ -201,24 +403,24 @@ def _gerar_trechos(nos, chaves, condutores):
     return trechos
 
 
-def _gerar_alimentadores(setores, trechos, chaves):
+def _gerar_alimentadores(doc, setores, trechos, chaves):
     # Busca e instanciamento dos objetos do tipo Alimentador
     print 'Gerando Alimentadores...'
-    alimentadores_xml = elementos.find_all('alimentador')
+    alimentadores_xml = doc.elementos.find_all('alimentador')
     alimentadores = dict()
 
     for alimen_tag in alimentadores_xml:
-        elemento_tag = topo.find_all('elemento', tipo='alimentador', nome=alimen_tag['nome'])[0]
+        elemento_tag = doc.indice[('alimentador', alimen_tag['nome'])]
         nomes_dos_trechos = [trecho['nome'] for trecho in elemento_tag.trechos.findChildren('trecho')]
         nomes_dos_setores = [setor['nome'] for setor in elemento_tag.setores.findChildren('setor')]
         nomes_das_chaves = [chave['nome'] for chave in elemento_tag.chaves.findChildren('chave')]
-        trechos_do_alimentador = [trecho for trecho in trechos.values() if trecho.nome in nomes_dos_trechos]
-        setores_do_alimentador = [setor for setor in setores.values() if setor.nome in nomes_dos_setores]
-        chaves_do_alimentador = [chave for chave in chaves.values() if chave.nome in nomes_das_chaves]
-        alimentadores[alimen_tag['nome']] = Alimentador(nome=alimen_tag['nome'],
-                                                        setores=setores_do_alimentador,
-                                                        trechos=trechos_do_alimentador,
-                                                        chaves=chaves_do_alimentador)
+        trechos_do_alimentador = [trechos[nome] for nome in nomes_dos_trechos]
+        setores_do_alimentador = [setores[nome] for nome in nomes_dos_setores]
+        chaves_do_alimentador = [chaves[nome] for nome in nomes_das_chaves]
+        alimentadores[alimen_tag['nome']] = AlimentadorIndexado(nome=alimen_tag['nome'],
+                                                                setores=setores_do_alimentador,
+                                                                trechos=trechos_do_alimentador,
+                                                                chaves=chaves_do_alimentador)
 
         print 'Ordenando alimentador...'
         print 'No Raiz: {raiz}'.format(raiz=elemento_tag.raiz.setor['nome'])
@@ -230,10 +432,10 @@ def _gerar_alimentadores(setores, trechos, chaves):
     return alimentadores
 
 
-def _gerar_transformadores():
+def _gerar_transformadores(doc):
     # Busca e instanciamento dos objetos do tipo Transformador
     print 'Gerando Transformadores'
-    transformadores_xml = elementos.find_all('transformador')
+    transformadores_xml = doc.elementos.find_all('transformador')
     transformadores = dict()
 
     for trafo_tag in transformadores_xml:
@@ -291,23 +493,22 @@ def _gerar_transformadores():
     return transformadores
 
 
-def _gerar_subestacaoes(alimentadores, transformadores):
+def _gerar_subestacaoes(doc, alimentadores, transformadores):
     # Busca e instanciamento dos objetos do tipo Subestacao
     print 'Gerando Subestações...'
-    subestacoes_xml = elementos.find_all('subestacao')
+    subestacoes_xml = doc.elementos.find_all('subestacao')
     subestacoes = dict()
 
     for sub_tag in subestacoes_xml:
-        elemento_tag = topo.find_all('elemento', tipo='subestacao', nome=sub_tag['nome'])[0]
+        elemento_tag = doc.indice[('subestacao', sub_tag['nome'])]
         nomes_dos_alimentadores = [alimentador['nome'] for alimentador in
                                    elemento_tag.alimentadores.findChildren('alimentador')]
 
-        alimentadores_da_subestacao = [alimentador for alimentador in alimentadores.values() if
-                                       alimentador.nome in nomes_dos_alimentadores]
+        alimentadores_da_subestacao = [alimentadores[nome] for nome in nomes_dos_alimentadores]
 
         nomes_dos_trafos = [trafo['nome'] for trafo in elemento_tag.transformadores.findChildren('transformador')]
 
-        trafos_da_subestacao = [trafo for trafo in transformadores.values() if trafo.nome in nomes_dos_trafos]
+        trafos_da_subestacao = [transformadores[nome] for nome in nomes_dos_trafos]
 
         subestacoes[sub_tag['nome']] = Subestacao(nome=sub_tag['nome'],
                                                   alimentadores=alimentadores_da_subestacao,
@@ -316,10 +517,9 @@ def _gerar_subestacaoes(alimentadores, transformadores):
     return subestacoes
 
 
-def _gerar_comunicacao():
-    Comunicacao = namedtuple('Comunicacao', ['nome', 'ip', 'porta'])
+def _gerar_comunicacao(doc):
     chaves_comunica_dict = {}
-    for i in com.find_all('elemento'):
+    for i in doc.com.find_all('elemento'):
         chaves_comunica_dict[i['nome']] = Comunicacao(
             i['nome'],
             str(i.endereco.ip.text),
@@ -328,5 +528,308 @@ def _gerar_comunicacao():
     return chaves_comunica_dict
 
 
+def _converter_multip(valor, multip):
+    # Aplica o multiplicador (k ou M) definido no atributo multip
+    if multip == 'k':
+        return float(valor) * 1e3
+    elif multip == 'M':
+        return float(valor) * 1e6
+    else:
+        return float(valor)
+
+
+def _valor_da_tag(tag):
+    return _converter_multip(tag.text, tag.get('multip'))
+
+
+def _nomes_filhos(tag, filho):
+    # Nomes de todos os descendentes do tipo filho,
+    # equivalente ao findChildren do BeautifulSoup
+    if tag is None:
+        return []
+    return [i.get('nome') for i in tag.iter(filho)]
+
+
+# ordem em que os elementos da topologia sao convertidos em objetos,
+# de modo que cada um encontre os elementos a que faz referencia
+ORDEM_TOPOLOGIA = ('no', 'setor', 'chave', 'trecho', 'alimentador', 'subestacao')
+
+
+def _carregar_topologia_iterparse(arquivo, ligacoes=None):
+    # Leitura em fluxo do arquivo xml: cada elemento filho de
+    # <elementos>, <topologia> e <comunicacao> e lido assim que sua
+    # tag e fechada e em seguida descartado, de forma que a memoria
+    # utilizada pelo xml fica limitada ao tamanho do maior elemento
+    # individual. Dos elementos da topologia sao guardados apenas os
+    # nomes que referenciam, e os objetos sao gerados ao final da
+    # leitura na ordem ORDEM_TOPOLOGIA, qualquer que seja a ordem dos
+    # elementos no arquivo.
+    # Se ligacoes for uma lista, as chaves ligadas a setores que nao
+    # estao no arquivo sao registradas nela como (chave, n1 ou n2,
+    # setor), em vez de gerar erro.
+    print 'Lendo %s em fluxo...' % arquivo
+
+    top = {'chaves': dict(),
+           'nos': dict(),
+           'setores': dict(),
+           'trechos': dict(),
+           'alimentadores': dict(),
+           'transformadores': dict(),
+           'subestacoes': dict(),
+           'comunicacao': dict()}
+
+    # dados lidos em <elementos> que so podem ser convertidos em
+    # objetos apos a leitura do respectivo elemento da topologia
+    pendentes = {'no': dict(), 'setor': dict(), 'trecho': dict(), 'ligacoes': ligacoes}
+    condutores = dict()
+    topologia = dict((tipo, list()) for tipo in ORDEM_TOPOLOGIA)
+
+    nivel = 0
+    secao = None
+    for evento, tag in iterparse(arquivo, events=('start', 'end')):
+        if evento == 'start':
+            nivel += 1
+            if nivel == 2:
+                secao = tag
+            continue
+
+        nivel -= 1
+        if nivel != 2 or not isinstance(tag.tag, basestring):
+            continue
+
+        if secao.tag == 'elementos':
+            _ler_elemento(tag, top, pendentes, condutores)
+        elif secao.tag == 'topologia':
+            if tag.get('tipo') in topologia:
+                topologia[tag.get('tipo')].append(_ler_elemento_da_topologia(tag))
+        elif secao.tag == 'comunicacao':
+            endereco = tag.find('endereco')
+            top['comunicacao'][tag.get('nome')] = Comunicacao(
+                tag.get('nome'),
+                str(endereco.findtext('ip')),
+                str(endereco.findtext('porta')))
+
+        _descartar(tag, secao)
+
+    for tipo in ORDEM_TOPOLOGIA:
+        for nome, dados in topologia[tipo]:
+            _gerar_elemento_da_topologia(tipo, nome, dados, top, pendentes, condutores)
+
+    return top
+
+
+def _descartar(tag, secao):
+    # descarta o elemento ja consumido. Com o lxml o elemento corrente
+    # ainda e referenciado pelo iterparse e nao pode ser removido da
+    # arvore: sao removidos apenas os irmaos anteriores a ele
+    tag.clear()
+    if hasattr(tag, 'getprevious'):
+        while tag.getprevious() is not None:
+            del secao[0]
+    else:
+        del secao[:]
+
+
+def _ler_elemento(tag, top, pendentes, condutores):
+    nome = tag.get('nome')
+
+    if tag.tag == 'chave':
+        if tag.get('estado') == 'fechado':
+            top['chaves'][nome] = Chave(nome=nome, estado=1)
+        elif tag.get('estado') == 'aberto':
+            top['chaves'][nome] = Chave(nome=nome, estado=0)
+    elif tag.tag == 'no':
+        potencia_ativa = potencia_reativa = 0.0
+        for potencia_tag in tag.iter('potencia'):
+            if potencia_tag.get('tipo') == 'ativa':
+                potencia_ativa = _valor_da_tag(potencia_tag)
+            elif potencia_tag.get('tipo') == 'reativa':
+                potencia_reativa = _valor_da_tag(potencia_tag)
+        pendentes['no'][nome] = (potencia_ativa, potencia_reativa)
+    elif tag.tag == 'setor':
+        pendentes['setor'][nome] = int(tag.get('prioridade'))
+    elif tag.tag == 'condutor':
+        condutores[nome] = Condutor(nome=nome,
+                                    rp=tag.get('rp'),
+                                    xp=tag.get('xp'),
+                                    rz=tag.get('rz'),
+                                    xz=tag.get('xz'),
+                                    ampacidade=tag.get('ampacidade'))
+    elif tag.tag == 'trecho':
+        pendentes['trecho'][nome] = _valor_da_tag(tag.find('comprimento'))
+    elif tag.tag == 'transformador':
+        top['transformadores'][nome] = _ler_transformador(tag)
+
+
+def _ler_transformador(tag):
+    tensoes = dict()
+    for enrolamento_tag in tag.iter('enrolamento'):
+        tensoes[enrolamento_tag.get('tipo')] = _valor_da_tag(enrolamento_tag.find('tensao'))
+
+    potencia = _valor_da_tag(tag.find('potencia'))
+
+    for impedancia_tag in tag.iter('impedancia'):
+        if impedancia_tag.get('tipo') == 'seq_pos':
+            resistencia = _valor_da_tag(impedancia_tag.find('resistencia'))
+            reatancia = _valor_da_tag(impedancia_tag.find('reatancia'))
+            break
+
+    return Transformador(nome=tag.get('nome'),
+                         tensao_primario=Fasor(mod=tensoes['primario'], ang=0.0,
+                                               tipo=Fasor.Tensao),
+                         tensao_secundario=Fasor(mod=tensoes['secundario'], ang=0.0,
+                                                 tipo=Fasor.Tensao),
+                         potencia=Fasor(mod=potencia, ang=0.0, tipo=Fasor.Potencia),
+                         impedancia=Fasor(real=resistencia, imag=reatancia,
+                                          tipo=Fasor.Impedancia))
+
+
+def _ler_elemento_da_topologia(tag):
+    # nomes dos elementos referenciados por um elemento da topologia
+    nome = tag.get('nome')
+    tipo = tag.get('tipo')
+
+    if tipo == 'no':
+        dados = (_nomes_filhos(tag.find('vizinhos'), 'no'),
+                 _nomes_filhos(tag.find('chaves'), 'chave'))
+    elif tipo == 'setor':
+        dados = (_nomes_filhos(tag, 'setor'), _nomes_filhos(tag, 'no'))
+    elif tipo == 'chave':
+        dados = tuple(tag.find(n).find('setor').get('nome') for n in ('n1', 'n2'))
+    elif tipo == 'trecho':
+        extremos = list()
+        for n in ('n1', 'n2'):
+            n_tag = tag.find(n)
+            if n_tag.find('no') is not None:
+                extremos.append(('no', n_tag.find('no').get('nome')))
+            elif n_tag.find('chave') is not None:
+                extremos.append(('chave', n_tag.find('chave').get('nome')))
+        dados = (extremos, tag.find('condutores').find('condutor').get('nome'))
+    elif tipo == 'alimentador':
+        dados = (_nomes_filhos(tag.find('setores'), 'setor'),
+                 _nomes_filhos(tag.find('trechos'), 'trecho'),
+                 _nomes_filhos(tag.find('chaves'), 'chave'),
+                 tag.find('raiz').find('setor').get('nome'))
+    elif tipo == 'subestacao':
+        dados = (_nomes_filhos(tag.find('alimentadores'), 'alimentador'),
+                 _nomes_filhos(tag.find('transformadores'), 'transformador'))
+    return nome, dados
+
+
+def _gerar_elemento_da_topologia(tipo, nome, dados, top, pendentes, condutores):
+    if tipo == 'no':
+        vizinhos, chaves = dados
+        potencia_ativa, potencia_reativa = pendentes['no'].pop(nome)
+        top['nos'][nome] = NoDeCarga(nome=nome,
+                                     vizinhos=vizinhos,
+                                     potencia=Fasor(real=potencia_ativa,
+                                                    imag=potencia_reativa,
+                                                    tipo=Fasor.Potencia),
+                                     chaves=chaves)
+    elif tipo == 'setor':
+        vizinhos, nos_do_setor = dados
+        nos = top['nos']
+        top['setores'][nome] = Setor(nome=nome,
+                                     vizinhos=vizinhos,
+                                     nos_de_carga=[nos[i] for i in nos_do_setor],
+                                     prioridade=pendentes['setor'].pop(nome))
+    elif tipo == 'chave':
+        chave = top['chaves'][nome]
+        for n, setor in zip(('n1', 'n2'), dados):
+            if setor not in top['setores'] and pendentes['ligacoes'] is not None:
+                pendentes['ligacoes'].append((nome, n, setor))
+            else:
+                setattr(chave, n, top['setores'][setor])
+    elif tipo == 'trecho':
+        extremos, condutor = dados
+        extremos = [top['nos' if n == 'no' else 'chaves'][i] for n, i in extremos]
+        top['trechos'][nome] = Trecho(nome=nome,
+                                      n1=extremos[0],
+                                      n2=extremos[1],
+                                      condutor=condutores[condutor],
+                                      comprimento=pendentes['trecho'].pop(nome))
+    elif tipo == 'alimentador':
+        nomes_setores, nomes_trechos, nomes_chaves, raiz = dados
+        setores, trechos, chaves = top['setores'], top['trechos'], top['chaves']
+        alimentador = AlimentadorIndexado(
+            nome=nome,
+            setores=[setores[i] for i in nomes_setores],
+            trechos=[trechos[i] for i in nomes_trechos],
+            chaves=[chaves[i] for i in nomes_chaves])
+        alimentador.ordenar(raiz=raiz)
+        alimentador.gerar_arvore_nos_de_carga()
+        top['alimentadores'][nome] = alimentador
+        print 'Alimentador %s criado.' % nome
+    elif tipo == 'subestacao':
+        nomes_alimentadores, nomes_transformadores = dados
+        alimentadores, transformadores = top['alimentadores'], top['transformadores']
+        top['subestacoes'][nome] = Subestacao(
+            nome=nome,
+            alimentadores=[alimentadores[i] for i in nomes_alimentadores],
+            transformadores=[transformadores[i] for i in nomes_transformadores])
+        print 'Subestacao %s criada.' % nome
+
+
+def _carregar_fragmento(arquivo):
+    # executada nos processos do pool: le um fragmento em fluxo e
+    # retorna a topologia parcial com as ligacoes nao resolvidas
+    ligacoes = list()
+    return _carregar_topologia_iterparse(arquivo, ligacoes), ligacoes
+
+
+def _carregar_topologia_fragmentada(fragmentos, processos=None):
+    print 'Lendo %d fragmentos de topologia...' % len(fragmentos)
+    if processos == 1 or len(fragmentos) == 1:
+        parciais = map(_carregar_fragmento, fragmentos)
+    else:
+        pool = multiprocessing.Pool(processos)
+        try:
+            parciais = pool.map(_carregar_fragmento, fragmentos)
+        finally:
+            pool.close()
+            pool.join()
+    return _ligar_fragmentos(parciais)
+
+
+def _ligar_fragmentos(parciais):
+    # Etapa de ligacao: une as topologias parciais e resolve as chaves
+    # de interconexao. Uma chave de interconexao e declarada em todos
+    # os fragmentos que a referenciam; a primeira copia encontrada e
+    # mantida e as demais sao substituidas por ela nos trechos e nos
+    # alimentadores.
+    top = dict((tipo, dict()) for tipo in ('chaves', 'nos', 'setores', 'trechos', 'alimentadores',
+                                           'transformadores', 'subestacoes', 'comunicacao'))
+    copias = dict()
+    ligacoes = list()
+
+    for parcial, ligacoes_parcial in parciais:
+        for nome, chave in parcial['chaves'].items():
+            canonica = top['chaves'].setdefault(nome, chave)
+            if canonica is not chave:
+                copias[id(chave)] = canonica
+                for n in ('n1', 'n2'):
+                    if not hasattr(canonica, n) and hasattr(chave, n):
+                        setattr(canonica, n, getattr(chave, n))
+        for tipo in top:
+            if tipo != 'chaves':
+                top[tipo].update(parcial[tipo])
+        ligacoes.extend(ligacoes_parcial)
+
+    for nome, n, setor in ligacoes:
+        setattr(top['chaves'][nome], n, top['setores'][setor])
+
+    if copias:
+        for trecho in top['trechos'].values():
+            trecho.n1 = copias.get(id(trecho.n1), trecho.n1)
+            trecho.n2 = copias.get(id(trecho.n2), trecho.n2)
+        for alimentador in top['alimentadores'].values():
+            for nome, chave in alimentador.chaves.items():
+                alimentador.chaves[nome] = copias.get(id(chave), chave)
+
+    print 'Topologia ligada: %d subestacoes, %d chaves de interconexao.' % (
+        len(top['subestacoes']), len(copias))
+    return top
+
+
 if __name__ == '__main__':
     top = carregar_topologia()